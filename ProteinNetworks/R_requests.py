@@ -1,15 +1,25 @@
+from   .instrumentation import echo, measure
+
+import csv
 import os
-import pandas as pd
 from   subprocess import Popen, PIPE
+import tempfile
+import threading
 
 
 # path to directory contains all RScripts
 RSCRIPTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'RScripts')
 
+# number of last lines of R error output which are shown when R worker is terminated
+STDERR_LINES = 30
+
+# R-packages which were found installed by Check_R_packages. They aren`t checked again in current session
+_checked_packages = set()
+
 def Check_R_packages(CRAN_packages:None, BiocManager_packages:None) -> bool:
     """
     function checks target R-packages among installed R-packages
-    function makes CMD request to RScript
+    function makes CMD request to RScript. Result is cached: packages found installed aren`t checked again
     :param CRAN_packages: list of CRAN packages to check
     :param BiocManager_packages: list of BiocManager packages to check
     :return:
@@ -17,6 +27,13 @@ def Check_R_packages(CRAN_packages:None, BiocManager_packages:None) -> bool:
     # if CRAN_packages is None, then CRAN_packages = empty list
     CRAN_packages = CRAN_packages or []
     BiocManager_packages = BiocManager_packages or []
+    packages = {('CRAN', p) for p in CRAN_packages} | {('BiocManager', p) for p in BiocManager_packages}
+    if packages.issubset(_checked_packages):
+        return False
+
+    temp_dir = tempfile.mkdtemp()
+    CRAN_file = os.path.join(temp_dir, 'temp_CRAN_packages.txt')
+    BiocManager_file = os.path.join(temp_dir, 'temp_BiocManager_packages.txt')
 
     s = ''
     for p in CRAN_packages:
@@ -24,7 +41,7 @@ def Check_R_packages(CRAN_packages:None, BiocManager_packages:None) -> bool:
 
     if len(s) > 0:
         CRAN = '1'
-        with open('temp_CRAN_packages.txt', 'w+') as f1:
+        with open(CRAN_file, 'w+') as f1:
             f1.write(s.rstrip(','))
             f1.write('\n')
     else:
@@ -36,7 +53,7 @@ def Check_R_packages(CRAN_packages:None, BiocManager_packages:None) -> bool:
 
     if len(s) > 0:
         BiocM = '1'
-        with open('temp_BiocManager_packages.txt', 'w+') as f2:
+        with open(BiocManager_file, 'w+') as f2:
             f2.write(s.rstrip(','))
             f2.write('\n')
     else:
@@ -46,28 +63,33 @@ def Check_R_packages(CRAN_packages:None, BiocManager_packages:None) -> bool:
     path2script = os.path.join(RSCRIPTS_PATH, 'check_packages.R')
 
     # Variable number of args in a list
-    args = [CRAN, BiocM]
+    args = [CRAN, BiocM, CRAN_file, BiocManager_file]
     # Build subprocess command
     cmd = [command, path2script] + args
     # check_output will run the command and store to result
-    p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    output, error = p.communicate()
+    with measure('Rscript.check_packages', kind='subprocess', rows_in=len(packages)) as event:
+        p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        output, error = p.communicate()
+        event['returncode'] = p.returncode
 
     # PRINT R CONSOLE OUTPUT (ERROR OR NOT)
     if p.returncode == 0 and len(output) > 2:
-        print(f'R OUTPUT:\n {output.decode("utf8")}')
+        echo(f'R OUTPUT:\n {output.decode("utf8")}')
         # TEMPORARY SOLUTION
         # Check for not installed packages message:
         if output.decode("utf8").find('Packages not found') != -1:
             installing = True
         else: installing = False
     else:
-        if len(error)>0: print(f'R ERROR:\n {error.decode("utf8")}')
+        if len(error)>0: echo(f'R ERROR:\n {error.decode("utf8")}')
         installing = False
+    if p.returncode == 0 and not installing:
+        _checked_packages.update(packages)
 
-    try: os.remove('temp_CRAN_packages.txt')
-    except: pass
-    try: os.remove('temp_BiocManager_packages.txt')
+    for file in (CRAN_file, BiocManager_file):
+        try: os.remove(file)
+        except: pass
+    try: os.rmdir(temp_dir)
     except: pass
 
     return installing
@@ -81,10 +103,124 @@ def short_R_output(text):
     :param text: text to be shortened
     :return: shortened text
     """
-    df = pd.DataFrame(text.split('\n'), columns=['text'])
-    new_text = df.text[df.text.apply(lambda x: True if x.find('[1]') >= 0 else False )].apply(lambda x: x.strip('[1] ').rstrip('\n')).apply(
-                    lambda x: str(x) + '\n').sum()
-    #isn`t working, for some reason 'contains' includs extra lines
-    #new_text = df.text[df.text.str.contains('[1]')].apply(lambda x: x.strip('[1] ').rstrip('\n')).apply(
-    #                lambda x: str(x) + '\n').sum()
-    return new_text
\ No newline at end of file
+    new_text = ''.join(line.strip('[1] ').rstrip('\n') + '\n' for line in text.split('\n') if line.find('[1]') >= 0)
+    return new_text
+
+
+class RWorker:
+    """
+    Long-lived R process for prioretizing GO-terms (see 'RScripts/Prioretizing_GO_worker.R').
+    R-packages are checked and loaded once when worker starts, so every request costs only GOxploreR computation.
+    Requests are sent through pipe, terms are exchanged through per-request temp files.
+    Worker can be used as context manager: with RWorker() as worker: ...
+    """
+
+    def __init__(self, command='Rscript'):
+        """
+        RWorker class constructor. R process is started by first request or by 'start' method
+        :param command: command to run R scripts
+        """
+        self.command = command
+        self.process = None
+        self._stderr = None # temp file with error output of R process
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        function starts R process and waits until it loads packages.
+        At the first launch R-packages are installed, it may take a long time (up to 20 minutes)
+        :return: None
+        """
+        if self.process is not None and self.process.poll() is None:
+            return
+        path2script = os.path.join(RSCRIPTS_PATH, 'Prioretizing_GO_worker.R')
+        self._close_stderr()
+        self._stderr = tempfile.TemporaryFile('w+')
+        self.process = Popen([self.command, path2script], stdin=PIPE, stdout=PIPE, stderr=self._stderr,
+                             text=True, bufsize=1)
+        ok, output = self._read_answer('@@READY@@')
+        if not ok:
+            raise Exception(f'R worker wasn`t started:\n {output}')
+
+    def _read_answer(self, marker='@@DONE@@'):
+        """
+        function reads output of R process until line with marker or error line
+        :param marker: line which marks successful end of answer
+        :return: (ok, output) - success flag and text printed by R before the end of answer
+        """
+        output = []
+        for line in self.process.stdout:
+            line = line.rstrip('\n')
+            if line == marker:
+                return True, '\n'.join(output)
+            if line.startswith('@@ERROR@@'):
+                output.append(line[len('@@ERROR@@'):].strip())
+                return False, '\n'.join(output)
+            output.append(line)
+        self.process.wait()
+        self.process = None
+        return False, '\n'.join(output + ['R process was terminated'] + self._read_stderr())
+
+    def _read_stderr(self) -> list:
+        """
+        function reads the last STDERR_LINES lines of error output of R process
+        :return: list of lines
+        """
+        if self._stderr is None:
+            return []
+        self._stderr.seek(0)
+        lines = self._stderr.read().rstrip('\n').split('\n')[-STDERR_LINES:]
+        return ['R error output:'] + lines if lines != [''] else []
+
+    def _close_stderr(self) -> None:
+        """
+        function removes temp file with error output of previous R process
+        """
+        if self._stderr is not None:
+            self._stderr.close()
+            self._stderr = None
+
+    def prioritize(self, terms, organism='Human', domain='BP') -> list:
+        """
+        function prioretizes GO-terms by GOxploreR in worker R process
+        :param terms: list of GO-terms
+        :param organism: name of target organism
+        :param domain: name of domain in GO-graph: 'BP', 'CC' or 'MF'
+        :return: list of Prioretized GO terms
+        """
+        with self._lock, tempfile.TemporaryDirectory() as temp_dir:
+            self.start()
+            input_name = os.path.join(temp_dir, 'input_priority_terms.csv')
+            output_name = os.path.join(temp_dir, 'output_priority_terms.csv')
+            with open(input_name, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Term'])
+                writer.writerows([term] for term in terms)
+
+            with measure('RWorker.prioritize', kind='subprocess', rows_in=len(terms)):
+                self.process.stdin.write('\t'.join([input_name, output_name, organism, domain]) + '\n')
+                self.process.stdin.flush()
+                ok, output = self._read_answer()
+            if not ok:
+                raise Exception(f'R ERROR:\n {output}')
+
+            with open(output_name, newline='') as f:
+                return [row[0] for row in list(csv.reader(f))[1:]]
+
+    def close(self) -> None:
+        """
+        function stops R process
+        :return: None
+        """
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+        self._close_stderr()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
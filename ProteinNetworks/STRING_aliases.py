@@ -0,0 +1,117 @@
+from   contextlib import closing
+import os
+import pandas as pd
+import sqlite3
+
+
+# priority of matches when one identifier matches several STRING proteins (lower is better)
+PRIORITY_STRING_ID = 0
+PRIORITY_PREFERRED_NAME = 1
+PRIORITY_UNIPROT = 2
+PRIORITY_OTHER = 3
+
+
+class STRINGAliasIndex:
+    """
+    Local index of STRING identifiers for mapping without network requests. It`s compiled once from STRING
+    '<species>.protein.aliases.<version>.txt.gz' and '<species>.protein.info.<version>.txt.gz' dumps
+    (see https://string-db.org/cgi/download) into SQLite file (see 'build')
+    """
+
+    def __init__(self, path):
+        """
+        STRINGAliasIndex class constructor. Opens compiled index read-only
+        :param path: path to index file made by 'build'
+        """
+        if not os.path.exists(path):
+            raise Exception(f'Index file {path} not found. Compile it by STRINGAliasIndex.build')
+        self.path = os.path.abspath(path)
+        with closing(self._connect()) as con:
+            meta = dict(con.execute('SELECT key, value FROM meta').fetchall())
+        self.species = int(meta['species'])
+        self.taxon_name = meta['taxon_name']
+
+    def _connect(self):
+        """
+        function opens read-only connection to index file
+        :return: sqlite3 connection
+        """
+        return sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+
+    @classmethod
+    def build(cls, aliases_path, info_path, path, species=9606, taxon_name='', chunksize: int = 500000):
+        """
+        function compiles STRING dumps into index file
+        :param aliases_path: path to '<species>.protein.aliases.<version>.txt(.gz)' file
+        :param info_path: path to '<species>.protein.info.<version>.txt(.gz)' file
+        :param path: path to index file. Existing file is rewritten
+        :param species: ID of organism
+        :param taxon_name: name of organism for 'taxonName' column. For example, 'Homo sapiens'
+        :param chunksize: number of rows of aliases file read at once
+        :return: STRINGAliasIndex
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        con = sqlite3.connect(path)
+        try:
+            con.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            con.executemany('INSERT INTO meta VALUES (?, ?)', [('species', str(species)), ('taxon_name', taxon_name)])
+            con.execute('CREATE TABLE proteins (id INTEGER PRIMARY KEY, string_id TEXT, preferred_name TEXT, '
+                        'annotation TEXT)')
+            con.execute('CREATE TABLE aliases (alias TEXT COLLATE NOCASE, protein INTEGER, priority INTEGER)')
+
+            info = pd.read_csv(info_path, sep='\t', usecols=[0, 1, 3], dtype=str)
+            info.columns = ['string_id', 'preferred_name', 'annotation']
+            info.insert(0, 'id', range(len(info)))
+            con.executemany('INSERT INTO proteins VALUES (?, ?, ?, ?)', info.itertuples(index=False, name=None))
+            protein_ids = pd.Series(info.id.to_numpy(), index=info.string_id)
+
+            con.executemany('INSERT INTO aliases VALUES (?, ?, ?)',
+                            zip(info.string_id, info.id, [PRIORITY_STRING_ID] * len(info)))
+            con.executemany('INSERT INTO aliases VALUES (?, ?, ?)',
+                            zip(info.preferred_name, info.id, [PRIORITY_PREFERRED_NAME] * len(info)))
+
+            for chunk in pd.read_csv(aliases_path, sep='\t', usecols=[0, 1, 2], dtype=str, chunksize=chunksize):
+                chunk.columns = ['string_id', 'alias', 'source']
+                chunk['protein'] = protein_ids.reindex(chunk.string_id).to_numpy()
+                chunk = chunk.dropna(subset=['protein', 'alias'])
+                priority = chunk.source.fillna('').str.contains('UniProt').map(
+                    {True: PRIORITY_UNIPROT, False: PRIORITY_OTHER})
+                con.executemany('INSERT INTO aliases VALUES (?, ?, ?)',
+                                zip(chunk.alias, chunk.protein.astype(int), priority))
+
+            con.execute('CREATE INDEX aliases_alias ON aliases (alias)')
+            con.commit()
+        finally:
+            con.close()
+        return cls(path)
+
+    def get_string_ids(self, identifiers, species=None, **params):
+        """
+        function maps identifiers to STRING ids like stringdb.get_string_ids with limit=1.
+        If identifier matches several proteins, the best match is chosen: STRING id, then preferred name,
+        then UniProt aliases, then other aliases
+        :param identifiers: list of protein identifiers
+        :param species: ID of organism. It must be the same as species of index
+        :param params: other parameters of stringdb.get_string_ids (ignored)
+        :return: DataFrame with columns 'queryIndex', 'queryItem', 'stringId', 'ncbiTaxonId', 'taxonName',
+                 'preferredName', 'annotation'
+        """
+        if species is not None and int(species) != self.species:
+            raise Exception(f'Index is compiled for species {self.species}, but species {species} was requested')
+        identifiers = [str(i) for i in identifiers]
+
+        with closing(self._connect()) as con:
+            con.execute('CREATE TEMP TABLE query (idx INTEGER, item TEXT COLLATE NOCASE)')
+            con.executemany('INSERT INTO query VALUES (?, ?)', enumerate(identifiers))
+            matches = pd.read_sql_query('SELECT q.idx AS queryIndex, q.item AS queryItem, p.string_id AS stringId, '
+                                        'p.preferred_name AS preferredName, p.annotation AS annotation, '
+                                        'a.priority AS priority, a.protein AS protein '
+                                        'FROM query q JOIN aliases a ON a.alias = q.item '
+                                        'JOIN proteins p ON p.id = a.protein', con)
+
+        matches = matches.sort_values(['queryIndex', 'priority', 'protein'], kind='stable')\
+            .drop_duplicates('queryIndex').reset_index(drop=True)
+        matches.insert(3, 'ncbiTaxonId', self.species)
+        matches.insert(4, 'taxonName', self.taxon_name)
+        return matches.drop(columns=['priority', 'protein'])
@@ -0,0 +1,199 @@
+from   .instrumentation import add_fields
+
+from   contextlib import contextmanager
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+
+# endpoints whose responses refer to positions of identifiers in request ('queryIndex' column), so their key
+# depends on order of identifiers
+ORDERED_ENDPOINTS = {'get_string_ids'}
+
+
+class STRINGCache:
+    """
+    Persistent content-addressed cache of STRING requests stored in SQLite file.
+    Key of request is hash of (endpoint, species, sorted set of identifiers, STRING version, other parameters),
+    so the lists with the same identifiers in different order share one record. Endpoints of ORDERED_ENDPOINTS are
+    keyed by ordered list of identifiers
+    """
+
+    def __init__(self, path='STRING_cache.sqlite', max_size_mb: float = 512, max_age_days: float = 30,
+                 offline: bool = False, string_version: str = None):
+        """
+        STRINGCache class constructor.
+        :param path: path to SQLite file of cache
+        :param max_size_mb: maximal size of stored responses (in Mb). Least recently used records are evicted first.
+                            None - no limit
+        :param max_age_days: maximal age of record (in days). Older records are evicted. None - no limit
+        :param offline: offline replay mode. Cache is read-only and every request which isn`t in cache raises error,
+                        so there are no network requests at all
+        :param string_version: version of STRING database (for example, '12.0'). Part of the key, so records of
+                               different versions don`t mix
+        """
+        self.path = os.path.abspath(path)
+        self.max_size = None if max_size_mb is None else int(max_size_mb * 1024 ** 2)
+        self.max_age = None if max_age_days is None else max_age_days * 24 * 3600
+        self.offline = offline
+        self.string_version = str(string_version)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if self.offline:
+            if not os.path.exists(self.path):
+                raise Exception(f'Cache file {self.path} not found. Offline replay mode needs existing cache')
+        else:
+            with self._connect() as con:
+                con.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, endpoint TEXT, '
+                            'created REAL, accessed REAL, size INTEGER, data BLOB)')
+            self.evict()
+
+    def __getstate__(self):
+        """
+        lock isn`t pickled, so cache can be sent to worker processes (they share the same SQLite file)
+        """
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        """
+        context manager opens new connection to cache file (read-only in offline mode), commits and closes it
+        :return: sqlite3 connection
+        """
+        if self.offline:
+            con = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+        else:
+            con = sqlite3.connect(self.path, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def make_key(self, endpoint: str, identifiers, species=9606, **params) -> str:
+        """
+        function makes content-addressed key of request
+        :param endpoint: name of STRING endpoint. For example, 'get_string_ids' or 'get_enrichment'
+        :param identifiers: list of protein identifiers
+        :param species: ID of organism
+        :param params: other parameters of request
+        :return: sha256 hex digest
+        """
+        ordered = endpoint in ORDERED_ENDPOINTS
+        content = {'endpoint': endpoint, 'species': int(species), 'version': self.string_version,
+                   'identifiers': list(map(str, identifiers)) if ordered else sorted(set(map(str, identifiers))),
+                   'ordered': ordered,
+                   'params': {k: sorted(map(str, v)) if isinstance(v, (list, tuple, set)) else str(v)
+                              for k, v in params.items() if v is not None}}
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf8')).hexdigest()
+
+    def get(self, key: str):
+        """
+        function returns cached DataFrame by key
+        :param key: key of request (see 'make_key')
+        :return: DataFrame or None if key isn`t in cache
+        """
+        with self._lock, self._connect() as con:
+            row = con.execute('SELECT data, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is not None and self.max_age is not None and not self.offline \
+                    and time.time() - row[1] > self.max_age:
+                con.execute('DELETE FROM responses WHERE key = ?', (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            if not self.offline:
+                con.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key: str, endpoint: str, df) -> None:
+        """
+        function saves DataFrame in cache. In offline replay mode does nothing
+        :param key: key of request (see 'make_key')
+        :param endpoint: name of STRING endpoint
+        :param df: DataFrame to save
+        :return: None
+        """
+        if self.offline:
+            return
+        data = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._lock, self._connect() as con:
+            con.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                        (key, endpoint, now, now, len(data), sqlite3.Binary(data)))
+        self.evict()
+
+    def request(self, endpoint: str, function, identifiers, species=9606, **params):
+        """
+        function returns response of STRING request from cache. If request isn`t in cache, it calls function and
+        saves its result
+        :param endpoint: name of STRING endpoint. For example, 'get_string_ids'
+        :param function: function making request. It`s called as function(identifiers, species=species, **params)
+        :param identifiers: list of protein identifiers
+        :param species: ID of organism
+        :param params: other parameters of request
+        :return: DataFrame
+        """
+        identifiers = list(identifiers)
+        key = self.make_key(endpoint, identifiers, species, **params)
+        df = self.get(key)
+        add_fields(cache_hit=df is not None)
+        if df is not None:
+            return df
+        if self.offline:
+            raise Exception(f'Request to "{endpoint}" isn`t found in cache. '
+                            f'Network requests are disabled in offline replay mode')
+        df = function(identifiers, species=species, **params)
+        self.put(key, endpoint, df)
+        return df
+
+    def evict(self) -> None:
+        """
+        function deletes records older than max_age and least recently used records exceeding max_size
+        :return: None
+        """
+        if self.offline:
+            return
+        with self._lock, self._connect() as con:
+            if self.max_age is not None:
+                con.execute('DELETE FROM responses WHERE created < ?', (time.time() - self.max_age,))
+            if self.max_size is not None:
+                total = con.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+                if total > self.max_size:
+                    for key, size in con.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+                        con.execute('DELETE FROM responses WHERE key = ?', (key,))
+                        total -= size
+                        if total <= self.max_size:
+                            break
+
+    def clear(self) -> None:
+        """
+        function deletes all records of cache and resets counters
+        :return: None
+        """
+        if not self.offline:
+            with self._lock, self._connect() as con:
+                con.execute('DELETE FROM responses')
+        self.hits, self.misses = 0, 0
+
+    def stats(self) -> dict:
+        """
+        function returns statistics of cache
+        :return: dict with number of hits, misses, records and size of cache (in bytes)
+        """
+        with self._lock, self._connect() as con:
+            records, size = con.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'records': records, 'size': size}
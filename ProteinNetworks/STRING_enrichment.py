@@ -1,27 +1,41 @@
 from   .R_requests import Check_R_packages, short_R_output
+from   .instrumentation import add_fields, echo, instrumented, is_quiet, measure
+from   .STRING_requests import AsyncSTRINGClient, get_string_ids_batched
+from   .local_enrichment import benjamini_hochberg
 
+import asyncio
 from   datetime import datetime
 import functools
-from   math import log
+import json
+import numpy as np
 import os
 import pandas as pd
+from   scipy import sparse
+import shutil
 import stringdb
 from   subprocess import Popen, PIPE
 from   tabulate import tabulate
+import tempfile
 
 
 # path to directory contains all RScripts
 RSCRIPTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'RScripts')
 
+# number of recently analysed subsets whose overlaps are kept as bases for 'get_subset_enrichment' (besides the whole
+# analysis). Every call compares subset with all kept states, so their number is small
+SUBSET_STATES = 4
+
 def display_df(df):
     """
     function for displaying DataFrames (df). If IPNB is used, df will display with common IPNB function 'Display', else:
-    it will display by print() function
+    it will display by echo() function
     :param df: DataFrame
     :return:
     """
+    if is_quiet():
+        return
     try: display(df)
-    except: print(df)
+    except: echo(df)
 
 def Check_Value(val:[str, float, int], valid_values:set, valname:str, message='Wrong value123'):
     """
@@ -44,7 +58,7 @@ def print_downline(line_length:int=40):
     :return:
     """
     line = '_'*line_length
-    print(f'{line}\n\n')
+    echo(f'{line}\n\n')
 
 def print_upline(title:str, line_length:int=40):
     """
@@ -53,20 +67,23 @@ def print_upline(title:str, line_length:int=40):
     :return:
     """
     line = '_'*line_length
-    print(f'\t{title}\n{line}')
+    echo(f'\t{title}\n{line}')
 
 def titler(title: str, line_length=40):
     """
-    Decorator added Title and edges of Paragraph
+    Decorator added Title and edges of Paragraph. Calls are measured (see 'instrumentation.instrumented'),
+    in quiet mode title and edges aren`t printed
     :param title: title
     :param line_length: length of line (number of '_' symbols)
     :return:
     """
     def titler_decorator(func):
+        measured = instrumented(func)
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             print_upline(title, line_length)
-            original_result = func(*args, **kwargs)
+            original_result = measured(*args, **kwargs)
             print_downline(line_length)
 
             return original_result
@@ -74,15 +91,133 @@ def titler(title: str, line_length=40):
     return titler_decorator
 
 
+def memoized(method):
+    """
+    Decorator caches results of EnrichmentAnalysis query method by its arguments.
+    Cache (self._memo) is reset every time self.enrichment is set or changed in place (see 'EnrichmentAnalysis._memo')
+    :param method: method with hashable positional arguments
+    :return:
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        key = (method.__name__,) + args
+        if key not in self._memo:
+            self._memo[key] = method(self, *args)
+        return self._memo[key]
+    return wrapper
+
+
+def build_gene_term_incidence(input_genes):
+    """
+    function parses 'inputGenes' column of enrichment table (comma separated genes of each term) into sparse
+    gene x term incidence matrix. Columns of matrix correspond to positions of rows in enrichment table
+    :param input_genes: Series of comma separated genes (column 'inputGenes' of enrichment table)
+    :return: (genes, matrix) - Index of genes (rows of matrix) and sparse CSC boolean matrix genes x terms
+    """
+    split = input_genes.fillna('').astype(str).str.strip().str.split(',')
+    term_idx = np.repeat(np.arange(len(split)), split.str.len().to_numpy())
+    gene_names = split.explode().astype(str).str.strip().to_numpy()
+    mask = gene_names != ''
+    codes, genes = pd.factorize(gene_names[mask])
+    matrix = sparse.csc_matrix((np.ones(len(codes), dtype=np.int8), (codes, term_idx[mask])),
+                               shape=(len(genes), len(split)))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1  # gene can be written twice in one term
+    return pd.Index(genes), matrix.astype(bool)
+
+
+def term_similarity_matrix(matrix, similarity='jaccard', threshold=0.5, groups=None, chunk_size: int = 1000):
+    """
+    function computes pairwise similarity of genes sets of terms by sparse product of incidence matrix. Terms are
+    sorted by group and size and processed by chunks, each chunk is multiplied only by terms of the same group which
+    can reach threshold (for jaccard: |B| <= |A| / threshold). Only pairs with similarity >= threshold are kept,
+    so memory is bounded by chunk_size x number of terms
+    :param matrix: sparse gene x term incidence matrix (see 'build_gene_term_incidence')
+    :param similarity: 'jaccard' - |A & B| / |A | B|, 'overlap' - |A & B| / min(|A|, |B|)
+    :param threshold: minimal similarity of kept pairs (from 0 to 1)
+    :param groups: array of group labels of terms (for example, categories). Only pairs within group are compared
+    :param chunk_size: number of terms processed at once
+    :return: sparse symmetric CSR matrix term x term with similarity of pairs (diagonal isn`t stored)
+    """
+    Check_Value(similarity, {'jaccard', 'overlap'}, 'similarity')
+    matrix = sparse.csc_matrix(matrix, dtype=np.float32)
+    n = matrix.shape[1]
+    sizes = np.asarray(matrix.sum(axis=0)).ravel()
+    groups = np.zeros(n, dtype=int) if groups is None else pd.factorize(np.asarray(groups))[0]
+
+    # terms sorted by group, then by size
+    order = np.lexsort((sizes, groups))
+    matrix, sizes, groups = matrix[:, order], sizes[order], groups[order]
+    transposed = matrix.T.tocsr()
+    group_ends = np.searchsorted(groups, groups, side='right')
+
+    rows, columns, values = [], [], []
+    start = 0
+    while start < n:
+        end = min(start + chunk_size, group_ends[start]) # chunk doesn`t cross groups
+        stop = group_ends[start]
+        if similarity == 'jaccard' and threshold > 0:
+            stop = start + np.searchsorted(sizes[start:stop], sizes[end - 1] / threshold, side='right')
+        intersection = (transposed[start:end] @ matrix[:, start:stop]).tocoo()
+        i, j, common = intersection.row + start, intersection.col + start, intersection.data
+        keep = j > i # each pair once
+        i, j, common = i[keep], j[keep], common[keep]
+        if similarity == 'jaccard':
+            value = common / (sizes[i] + sizes[j] - common)
+        else:
+            value = common / np.minimum(sizes[i], sizes[j])
+        keep = value >= threshold
+        rows.append(order[i[keep]])
+        columns.append(order[j[keep]])
+        values.append(value[keep].astype(np.float32))
+        start = end
+
+    rows, columns, values = (np.concatenate(a) if a else np.empty(0) for a in (rows, columns, values))
+    upper = sparse.csr_matrix((values, (rows, columns)), shape=(n, n))
+    return (upper + upper.T).tocsr()
+
+
+def safe_name(name: str) -> str:
+    """
+    function replaces symbols which aren`t allowed in names of xlsx sheets and files by '_'
+    :param name: name of sheet or file (for example, name of category)
+    :return: name
+    """
+    for symbol in '[]:*?/\\<>"|':
+        name = name.replace(symbol, '_')
+    return name
+
+
+def write_sheet(workbook, name: str, table, chunksize: int = 10000) -> None:
+    """
+    function writes DataFrame into new sheet of xlsxwriter workbook row by row, so it works with constant_memory
+    mode of workbook (rows are flushed to disk as soon as the next row is started)
+    :param workbook: xlsxwriter.Workbook object
+    :param name: name of sheet. Symbols which aren`t allowed in sheet names are replaced by '_' (see 'safe_name')
+    :param table: DataFrame
+    :param chunksize: number of rows converted to python objects at once
+    :return: None
+    """
+    worksheet = workbook.add_worksheet(safe_name(name)[:31])
+    worksheet.write_row(0, 0, [str(column) for column in table.columns])
+    for start in range(0, len(table), chunksize):
+        chunk = table.iloc[start:start + chunksize]
+        columns = [chunk[column].astype(object).where(chunk[column].notna(), None).to_list()
+                   for column in chunk.columns]
+        for i, row in enumerate(zip(*columns), start=start + 1):
+            worksheet.write_row(i, 0, row)
+
+
 class EnrichmentAnalysis:
     types = {'UniProtID': 'queryItem', 'Gene': 'preferredName'}
 
-    def __init__(self, data, enrichment = None, protein_id_type='UniProtID'):
+    def __init__(self, data, enrichment = None, protein_id_type='UniProtID', cache=None):
         """
         EnrichmentAnalysis class conctructor.
         :param data: Dataframe containing the protein ID for analysis. It must contain either a "Gene" or "UniProtID" column'
         :param enrichment: Dataframe containing the results of previous enrichment analysis
         :param protein_id_type: type of protein ID. Valid Types
+        :param cache: STRINGCache object. If it`s given, requests to STRING are taken from persistent cache
         """
         #check correctness of inputs
         self.protein_id_type = protein_id_type
@@ -91,6 +226,64 @@ class EnrichmentAnalysis:
         self.orig_data = data
         self.proteins = self.orig_data[self.protein_id_type]
         self.enrichment = enrichment # enrichment from previous analysis
+        self.cache = cache
+        self.species = 9606
+
+    @property
+    def enrichment(self):
+        return self._enrichment
+
+    @enrichment.setter
+    def enrichment(self, enrichment):
+        """
+        every new enrichment table resets cached query results built from previous one.
+        'category' column is stored as categorical and positions of rows of each category are indexed
+        """
+        if enrichment is not None and not isinstance(enrichment.category.dtype, pd.CategoricalDtype):
+            enrichment = enrichment.assign(category=enrichment.category.astype('category'))
+        self._enrichment = enrichment
+        self._reset_cache()
+
+    def _reset_cache(self):
+        """
+        function drops cached query results, indexes rows of categories and remembers fingerprint of enrichment
+        table: its index, columns and length. In-place changes of rows (sort_values, drop, reset_index, new columns
+        with inplace=True) make new index or columns, so they are found by fingerprint. Changes of values by
+        .loc/.iloc aren`t found: set self.enrichment again after them
+        """
+        enrichment = self._enrichment
+        self._query_cache = {}
+        self._category_index = {} if enrichment is None else \
+            dict(enrichment.groupby('category', observed=True, sort=False).indices)
+        self._fingerprint = None if enrichment is None else (enrichment.index, enrichment.columns, len(enrichment))
+
+    def _check_cache(self):
+        """
+        function resets cached query results if enrichment table was changed in place (see '_reset_cache')
+        """
+        enrichment = self._enrichment
+        if enrichment is not None and (enrichment.index is not self._fingerprint[0] or
+                                       enrichment.columns is not self._fingerprint[1] or
+                                       len(enrichment) != self._fingerprint[2]):
+            if not isinstance(enrichment.category.dtype, pd.CategoricalDtype):
+                enrichment['category'] = enrichment.category.astype('category')
+            self._reset_cache()
+
+    @property
+    def _memo(self):
+        """
+        cache of query results (see 'memoized')
+        """
+        self._check_cache()
+        return self._query_cache
+
+    @property
+    def _category_rows(self):
+        """
+        dict {category: positions of rows of category in enrichment table}
+        """
+        self._check_cache()
+        return self._category_index
 
     def _check_proteins_column(self, data):
         """
@@ -107,17 +300,131 @@ class EnrichmentAnalysis:
             p_id = next(iter(valid_cols))
             if self.protein_id_type != p_id:
                 self.protein_id_type = p_id
-                print(f'You choose "protein_id_type" that wasn`t contained in your data. '
+                echo(f'You choose "protein_id_type" that wasn`t contained in your data. '
                       f'"protein_id_type" is changed to "{self.protein_id_type}"\n')
         elif len(valid_cols) == 2:
             pass
 
+    @memoized
     def _get_valid_category(self)->set:
         """
         function return set of valid category names for current enrichment analysis
         :return:
         """
-        return set(self.enrichment.category.unique())
+        return set(self._category_rows)
+
+    def _get_category_data(self, category):
+        """
+        function returns rows of enrichment table of chosen category
+        :param category: Name of category
+        :return: DataFrame
+        """
+        return self.enrichment.iloc[self._category_rows.get(category, [])]
+
+    @memoized
+    def _get_category_terms(self, category, term_type):
+        """
+        memoized part of 'get_category_terms'
+        """
+        d_term = {'id': 'term', 'description': 'description'} # dict associate term_type and colnames of enrichment table
+        return set(self._get_category_data(category)[d_term[term_type]])
+
+    @memoized
+    def _get_category_terms_table(self, category, sort_by):
+        """
+        function makes table of terms of category and numbers of associated genes (see 'show_category_terms')
+        :param category: Name of category
+        :param sort_by: ["genes", "term"] - sort by number of genes (by descending) or term names (by ascending)
+        :return: DataFrame with columns 'Term', '# Genes'
+        """
+        category_data = self._get_category_data(category).drop_duplicates('description')
+        df = pd.DataFrame({'Term': category_data.description.to_numpy(),
+                           '# Genes': category_data.number_of_genes.to_numpy()})
+        if sort_by == 'genes':
+            df.sort_values('# Genes', ascending = False, inplace=True)
+        elif sort_by == 'term':
+            df.sort_values('Term', ascending = True, inplace=True)
+        return df
+
+    @memoized
+    def _get_sorted_category_data(self, category, sort_by):
+        """
+        function returns rows of enrichment table of chosen category sorted by column %sort_by
+        """
+        return self._get_category_data(category).sort_values(by=sort_by)
+
+    @memoized
+    def _get_term_positions(self, column='term'):
+        """
+        function returns dict {term: position of first row of term in enrichment table}
+        :param column: 'term' or 'description'
+        :return: dict
+        """
+        terms = self.enrichment[column]
+        first = ~terms.duplicated().to_numpy()
+        return dict(zip(terms.to_numpy()[first], np.flatnonzero(first)))
+
+    @memoized
+    def _get_component_positions(self):
+        """
+        function returns dict {compartment description: position of first row in enrichment table}
+        """
+        positions = self._category_rows.get('Component', np.empty(0, dtype=int))
+        descriptions = self.enrichment.description.to_numpy()[positions]
+        return dict(zip(descriptions[::-1], positions[::-1]))
+
+    def _get_incidence(self, df=None):
+        """
+        function returns gene x term incidence matrix of enrichment table (see 'build_gene_term_incidence').
+        Incidence of self.enrichment is built once and cached
+        :param df: enrichment DataFrame. By default, self.enrichment
+        :return: (genes, matrix) - Index of genes and sparse CSC matrix genes x rows of df
+        """
+        if df is not None and df is not self.enrichment:
+            return build_gene_term_incidence(df.inputGenes)
+        if 'incidence' not in self._memo:
+            self._memo['incidence'] = build_gene_term_incidence(self.enrichment.inputGenes)
+        return self._memo['incidence']
+
+    @memoized
+    def _get_term_similarity(self, similarity, threshold, within_category, chunk_size):
+        """
+        function returns similarity matrix of terms of enrichment table (see 'term_similarity_matrix')
+        """
+        _, matrix = self._get_incidence()
+        groups = self.enrichment.category.to_numpy() if within_category else None
+        return term_similarity_matrix(matrix, similarity, threshold, groups, chunk_size)
+
+    def _string_request(self, endpoint: str, identifiers, function=None, **params):
+        """
+        function makes request to STRING by stringdb function with name %endpoint. If self.cache is given, response
+        is taken from cache
+        :param endpoint: name of stringdb function: 'get_string_ids' or 'get_enrichment'
+        :param identifiers: list of protein identifiers
+        :param function: function which makes request instead of stringdb function. It must return the same results
+        :param params: other parameters of request
+        :return: DataFrame
+        """
+        function = function or getattr(stringdb, endpoint)
+        with measure(f'STRING.{endpoint}', kind='network', rows_in=len(identifiers)) as event:
+            if self.cache is None:
+                df = function(identifiers, species=self.species, **params)
+            else:
+                df = self.cache.request(endpoint, function, identifiers, species=self.species, **params)
+            event['rows_out'] = len(df)
+        return df
+
+    def _get_term_genes_mask(self, position, universe):
+        """
+        function returns boolean mask of genes from universe which are associated with term
+        :param position: position of term row in self.enrichment
+        :param universe: Index of genes
+        :return: numpy boolean array with len(universe) elements
+        """
+        genes, matrix = self._get_incidence()
+        mask = np.zeros(len(universe), dtype=bool)
+        mask[universe.get_indexer(genes[matrix[:, position].indices])] = True
+        return mask
 
     def _find_nomapped_genes(self):
         """
@@ -146,16 +453,17 @@ class EnrichmentAnalysis:
         self.orig_data.drop_duplicates(subset=subset, inplace=True)
         self.proteins = self.orig_data[self.protein_id_type]
         if not silent:
-            print(f'{len(duplicates)} of {len_orig_set} genes was dropped from original set')
+            echo(f'{len(duplicates)} of {len_orig_set} genes was dropped from original set')
             if len(duplicates) < 1:
                 return duplicates
             elif len(duplicates) < 20:
-                print('Dropped rows from original set:')
-                print(duplicates[self.protein_id_type])
+                echo('Dropped rows from original set:')
+                echo(duplicates[self.protein_id_type])
             elif len(duplicates) < 80:
-                print('Dropped genes from original set:\n', *list(duplicates.protein_id_type))
+                echo('Dropped genes from original set:\n', *list(duplicates.protein_id_type))
         return duplicates
 
+    @instrumented
     def get_category_terms(self, category:str, term_type:str='id')->set:
         """
         function returns set of all terms in chosen category
@@ -165,30 +473,131 @@ class EnrichmentAnalysis:
                 description - returns Description of IDs of category
         :return: set of terms
         """
-        d_term = {'id': 'term', 'description': 'description'} # dict associate term_type and colnames of enrichment table
         valid_category = self._get_valid_category()
         Check_Value(category, valid_category, 'category')
         Check_Value(term_type, {'description', 'id'}, 'term_type')
-        return set(self.enrichment[d_term[term_type]][self.enrichment.category == category])
+        return set(self._get_category_terms(category, term_type))
 
-    def get_enrichment(self):
+    @instrumented
+    def get_enrichment(self, backend='string', annotation=None, background=None):
         """
         function performs enrichment analysis. Results store in self.enrichment
+        :param backend: 'string' - enrichment by STRING web service,
+                        'local' - enrichment by local annotation table without network requests
+        :param annotation: work with backend='local', AnnotationTable object (see 'local_enrichment' module)
+        :param background: work with backend='local', list of background genes (identifiers of annotation).
+                           By default, all genes of annotation
         :return:
         """
-        self.enrichment = stringdb.get_enrichment(self.genes_mapped.queryItem) #get enrichment
-        self.enrichment['enrich_score'] = self.enrichment.fdr.apply(lambda x: round(-log(x, 2), 1)) #get enrichment score
-
+        Check_Value(backend, {'string', 'local'}, 'backend')
+        if backend == 'string':
+            enrichment = self._string_request('get_enrichment', self.genes_mapped.queryItem) #get enrichment
+        else:
+            if annotation is None:
+                raise Exception('Local enrichment needs annotation table. Load it by AnnotationTable.from_string_terms '
+                                'or AnnotationTable.from_gaf')
+            enrichment = annotation.enrich(self.genes_mapped[annotation.id_column],
+                                           input_names=self.genes_mapped.queryItem,
+                                           preferred_names=self.genes_mapped.preferredName,
+                                           background=background)
+        enrichment['enrich_score'] = np.round(-np.log2(enrichment.fdr.to_numpy(dtype=float)), 1) #get enrichment score
+        self.enrichment = enrichment
+        add_fields(rows_out=len(enrichment))
+
+    @instrumented
+    def get_permutation_fdr(self, annotation, background=None, permutations: int = 1000, workers: int = None,
+                            seed: int = 0, batch_size: int = 100):
+        """
+        function computes empirical significance of terms of enrichment table by random gene sets of the same size
+        drawn from background (see 'AnnotationTable.permutation_test'). Columns 'empirical_p' and 'empirical_fdr'
+        (Benjamini-Hochberg within each category) are added to self.enrichment
+        :param annotation: AnnotationTable object (see 'local_enrichment' module)
+        :param background: list of background genes (identifiers of annotation). By default, all genes of annotation
+        :param permutations: number of random gene sets
+        :param workers: number of worker processes. By default, number of CPUs
+        :param seed: seed of random generator. Results are reproducible for the same seed and batch_size
+        :param batch_size: number of random gene sets scored at once
+        :return:
+        """
+        if self.enrichment is None:
+            raise Exception('Enrichment table is empty. Call "get_enrichment" first')
+        empirical_p = annotation.permutation_test(self.genes_mapped[annotation.id_column], self.enrichment,
+                                                  background=background, permutations=permutations, workers=workers,
+                                                  seed=seed, batch_size=batch_size)
+        found = ~np.isnan(empirical_p)
+        empirical_fdr = np.full(len(empirical_p), np.nan)
+        empirical_fdr[found] = benjamini_hochberg(empirical_p[found], self.enrichment.category.to_numpy()[found])
+        self.enrichment = self.enrichment.assign(empirical_p=empirical_p, empirical_fdr=empirical_fdr)
+
+    @instrumented
+    def get_subset_enrichment(self, proteins, annotation, background=None, fdr_threshold: float = 0.05):
+        """
+        function performs enrichment analysis of subset of proteins (for example, results of
+        'get_genes_by_localization') by local annotation table. Overlaps of terms with subset are updated from the
+        closest previously analysed gene set (this analysis or one of SUBSET_STATES last subsets) by added and removed
+        genes only. Results are memoized by gene set, so repeated drill-downs return immediately
+        :param proteins: list of protein IDs of subset (the same type as self.proteins)
+        :param annotation: AnnotationTable object (see 'local_enrichment' module)
+        :param background: list of background genes (identifiers of annotation). By default, all genes of annotation
+        :param fdr_threshold: only terms with fdr <= fdr_threshold are kept. None - keep all terms with genes
+        :return: EnrichmentAnalysis of subset
+        """
+        genes_mapped = self.genes_mapped[self.genes_mapped.queryItem.isin(set(proteins))].reset_index(drop=True)
+        genes = genes_mapped[annotation.id_column].astype(str)
+        if background is not None:
+            background = pd.Index(pd.Series(background, dtype=object).astype(str)).unique()
+            genes_mapped, genes = genes_mapped[genes.isin(background).to_numpy()], genes[genes.isin(background)]
+        background_key = None if background is None else hash(tuple(background))
+
+        key = ('subset_enrichment', annotation, frozenset(genes), background_key, fdr_threshold)
+        if key not in self._memo:
+            # the closest analysed gene set is a base for updating of overlaps. states[0] - the whole analysis,
+            # others - the last analysed subsets (the least recently used is dropped)
+            states = self._memo.setdefault(('subset_states', annotation, background_key), [])
+            if not states:
+                parent_genes = self.genes_mapped[annotation.id_column].astype(str)
+                if background is not None:
+                    parent_genes = parent_genes[parent_genes.isin(background)]
+                states.append(annotation.overlap_counts(parent_genes))
+            rows = annotation.genes.get_indexer(genes.unique())
+            rows = np.unique(rows[rows >= 0])
+            i = min(range(len(states)), key=lambda i: len(np.setxor1d(states[i][0], rows, assume_unique=True)))
+            state = annotation.overlap_counts(genes, base=states[i])
+            if i > 0:
+                states.append(states.pop(i))
+            states.append(state)
+            if len(states) > SUBSET_STATES + 1:
+                del states[1]
+
+            enrichment = annotation.enrich(genes, input_names=genes_mapped.queryItem,
+                                           preferred_names=genes_mapped.preferredName, background=background,
+                                           fdr_threshold=fdr_threshold, counts=state[1])
+            enrichment['enrich_score'] = np.round(-np.log2(enrichment.fdr.to_numpy(dtype=float)), 1)
+            self._memo[key] = enrichment.assign(category=enrichment.category.astype('category'))
+
+        subset = EnrichmentAnalysis(pd.DataFrame({self.protein_id_type: genes_mapped.queryItem.to_numpy()}),
+                                    protein_id_type=self.protein_id_type, cache=self.cache)
+        subset.species = self.species
+        subset.genes_mapped = genes_mapped
+        subset.nomapped_genes, subset.overmapped_genes = [], []
+        subset.enrichment = self._memo[key]
+        return subset
+
+    @instrumented
     def get_genes_of_term(self, term:str)-> list:
         """
         function get genes from enrichment table by target term
         :param term: target GO term from column 'term' in enrichment table
         :return: list of genes associated with target term
         """
-        try:
-            return self.enrichment.inputGenes[self.enrichment.term == term].to_list()[0].rstrip().strip().split(',')
-        except: print('Term not found')
-
+        position = self._get_term_positions('term').get(term)
+        genes = None if position is None else self.enrichment.inputGenes.iat[position]
+        if not isinstance(genes, str):
+            echo('Term not found')
+            return None
+        return genes.strip().split(',') # genes in the same order as in 'inputGenes'
+
+    @instrumented
     def get_genes_by_localization(self, compartments: list, set_operation: str, save=False):
         """
         function for getting proteins localized in target compartments. You also can do common set operations
@@ -214,39 +623,26 @@ class EnrichmentAnalysis:
                                 'call <<show_category_terms("Components")>>. '
                                 'If you want to get all genes, use tag "all" in compartments list')
 
-        # define common set operations
-        def union(a: set, b: set) -> set:
-            return a.union(b)
-
-        def intersection(a: set, b: set) -> set:
-            return a.intersection(b)
-
-        def difference(a: set, b: set) -> set:
-            return a.difference(b)
+        # define common set operations under boolean masks of genes
+        operations = {'union': np.logical_or, 'intersection': np.logical_and,
+                      'difference': lambda a, b: a & ~b, 'symmetric_difference': np.logical_xor}
 
-        def symmetric_difference(a: set, b: set) -> set:
-            return a.symmetric_difference(b)
+        # first row of each 'Component' description in enrichment data
+        component_position = self._get_component_positions()
 
-        operations = {'union': union, 'intersection': intersection, 'difference': difference,
-                      'symmetric_difference': symmetric_difference}
+        # universe contains all genes of enrichment table and all proteins of dataset
+        genes, _ = self._get_incidence()
+        universe = genes.append(pd.Index(self.proteins.unique()).difference(genes, sort=False))
+        all_mask = universe.isin(self.proteins)
 
-        # choose all strings in enrichment data connected with 'Component'
-        component_data = self.enrichment[self.enrichment.category == 'Component']
-
-        # create location genes set and apply set_operation for each compartment gene set
-        if compartments[0] == 'all':
-            loc_genes = set(self.proteins)
-        else:
-            loc_genes = set(component_data.inputGenes[component_data.description == compartments[0]]
-                            .to_list()[0].rstrip().strip().split(','))
-        for i in range(1, len(compartments)):
-            if compartments[i] == 'all':
-                compartment_genes = set(self.proteins)
-            else:
-                compartment_genes = set(component_data.inputGenes[component_data.description == compartments[i]]
-                                        .to_list()[0].rstrip().strip().split(','))
-            loc_genes = operations[set_operation](loc_genes, compartment_genes)
-        print(f'{len(loc_genes)} genes was founded\n')
+        # create location genes mask and apply set_operation for each compartment genes mask
+        masks = [all_mask if c == 'all' else self._get_term_genes_mask(component_position[c], universe)
+                 for c in compartments]
+        loc_mask = masks[0]
+        for mask in masks[1:]:
+            loc_mask = operations[set_operation](loc_mask, mask)
+        loc_genes = universe[loc_mask].to_list()
+        echo(f'{len(loc_genes)} genes was founded\n')
 
         if save: # save genes in txt format (1 gene on 1 string)
             filename = 'Genes_' + '_'.join(compartments)
@@ -256,28 +652,155 @@ class EnrichmentAnalysis:
             with open(filename, 'w+') as f:
                 for term in loc_genes:
                     f.write(term + '\n')
-            print(f'File {filename} successfully saved in {os.path.abspath(os.getcwd())}\n')
+            echo(f'File {filename} successfully saved in {os.path.abspath(os.getcwd())}\n')
 
-        return list(loc_genes)
+        return loc_genes
+
+    @instrumented
+    def reduce_redundant_terms(self, categories: list = None, similarity='jaccard', threshold: float = 0.5,
+                               within_category: bool = True, chunk_size: int = 1000) -> pd.DataFrame:
+        """
+        function clusters terms with similar sets of input genes and keeps one representative per cluster.
+        Clusters are formed greedily: the most significant (by fdr) unassigned term becomes representative and takes
+        all unassigned terms with similarity >= threshold. It works for all categories, unlike 'prioretizingGO'
+        :param categories: list of categories. By default, all categories of enrichment table
+        :param similarity: 'jaccard' or 'overlap' coefficient of input genes sets (see 'term_similarity_matrix')
+        :param threshold: minimal similarity of terms in one cluster (from 0 to 1)
+        :param within_category: compare terms of the same category only
+        :param chunk_size: number of terms compared at once (bounds memory)
+        :return: DataFrame of representative terms sorted by fdr with columns 'cluster_size' (number of terms in
+                 cluster) and 'redundant_terms' (comma separated IDs of other terms of cluster)
+        """
+        Check_Value(similarity, {'jaccard', 'overlap'}, 'similarity')
+        if categories is None:
+            selected = np.ones(len(self.enrichment), dtype=bool)
+        else:
+            valid_category = self._get_valid_category()
+            for category in categories:
+                Check_Value(category, valid_category, 'category')
+            selected = np.zeros(len(self.enrichment), dtype=bool)
+            for category in categories:
+                selected[self._category_rows[category]] = True
+
+        matrix = self._get_term_similarity(similarity, float(threshold), within_category, chunk_size)
+        order = np.lexsort((-self.enrichment.number_of_genes.to_numpy(), self.enrichment.fdr.to_numpy(dtype=float)))
+        order = order[selected[order]]
+
+        # greedy clustering from the most significant term
+        cluster = np.full(len(self.enrichment), -1)
+        indptr, indices = matrix.indptr, matrix.indices
+        for position in order:
+            if cluster[position] >= 0:
+                continue
+            neighbors = indices[indptr[position]:indptr[position + 1]]
+            neighbors = neighbors[(cluster[neighbors] < 0) & selected[neighbors]]
+            cluster[neighbors] = position
+            cluster[position] = position
+
+        representatives = order[cluster[order] == order]
+        members = np.flatnonzero((cluster >= 0) & (cluster != np.arange(len(cluster))))
+        redundant = pd.Series(self.enrichment.term.to_numpy()[members], dtype=str)\
+            .groupby(cluster[members], sort=False).agg(','.join)
+
+        table = self.enrichment.iloc[representatives].reset_index(drop=True)
+        table['cluster_size'] = np.bincount(cluster[cluster >= 0], minlength=len(cluster))[representatives]
+        table['redundant_terms'] = redundant.reindex(representatives).fillna('').to_numpy()
+        return table
+
+    @instrumented
+    def get_subnetwork(self, network, min_score: int = None):
+        """
+        function extracts protein-protein interaction subnetwork of mapped genes (self.genes_mapped)
+        :param network: ProteinNetwork object (see 'STRING_network' module)
+        :param min_score: minimal score of interaction. None - all interactions of network
+        :return: ProteinNetwork
+        """
+        return network.subnetwork(self.genes_mapped.stringId, min_score=min_score)
 
     @titler('MAPPING GENES IN STRING')
-    def get_mapped(self, species=9606):
+    def get_mapped(self, species=9606, chunk_size: int = None, workers: int = 4, retries: int = 3,
+                   rate_limit: float = None, backend='string', alias_index=None):
         """
         function makes gene mapping, it finds STRINGids by protein ids. It`s important for future analysis
         :param species: ID of organism. For example, Human species=9606
+        :param chunk_size: None - all proteins are mapped by one request. Integer number - proteins are split into
+                           chunks of this size, which are mapped concurrently (use it for large protein lists)
+        :param workers: work with chunk_size, number of concurrent requests
+        :param retries: work with chunk_size, number of repeats of failed chunk request
+        :param rate_limit: work with chunk_size, maximal number of requests per second. None - no limit
+        :param backend: 'string' - mapping by STRING web service, 'local' - mapping by local alias index
+        :param alias_index: work with backend='local', STRINGAliasIndex object (see 'STRING_aliases' module)
         :return: None
         """
-
-        self.genes_mapped = stringdb.get_string_ids(self.proteins, species=species)
+        Check_Value(backend, {'string', 'local'}, 'backend')
+
+        self.species = species
+        if backend == 'local':
+            if alias_index is None:
+                raise Exception('Local mapping needs alias index. Compile it by STRINGAliasIndex.build')
+            self.genes_mapped = alias_index.get_string_ids(self.proteins, species=species)
+        elif chunk_size is None:
+            self.genes_mapped = self._string_request('get_string_ids', self.proteins)
+        else:
+            batched = functools.partial(get_string_ids_batched, chunk_size=chunk_size, workers=workers,
+                                        retries=retries, rate_limit=rate_limit)
+            self.genes_mapped = self._string_request('get_string_ids', self.proteins, function=batched)
         self.nomapped_genes, self.overmapped_genes = self._find_nomapped_genes()
-        print(
+        add_fields(rows_out=len(self.genes_mapped))
+        echo(
             f'{len(self.genes_mapped.queryItem.unique())} of {len(set(self.proteins.unique()))} unique genes were mapped\n')
         if len(self.nomapped_genes) < 80:
-            print('List of nomapped genes:\n', list(self.nomapped_genes))
+            echo('List of nomapped genes:\n', list(self.nomapped_genes))
         if len(self.overmapped_genes) < 80:
-            print('List of overmapped genes:\n', list(self.overmapped_genes))
+            echo('List of overmapped genes:\n', list(self.overmapped_genes))
+
+    async def aget_mapped(self, species=9606, client=None, chunk_size: int = None):
+        """
+        asyncio version of 'get_mapped' (backend='string'). Results are the same, but nothing is printed.
+        Chunks of proteins are mapped concurrently (and cached separately, if self.cache is given)
+        :param species: ID of organism. For example, Human species=9606
+        :param client: AsyncSTRINGClient object shared between analyses (see 'STRING_requests' module).
+                       By default, new client is made for this call
+        :param chunk_size: None - all proteins are mapped by one request. Integer number - proteins are split into
+                           chunks of this size
+        :return: None
+        """
+        if client is None:
+            async with AsyncSTRINGClient() as client:
+                return await self.aget_mapped(species=species, client=client, chunk_size=chunk_size)
+
+        self.species = species
+        identifiers = [str(i) for i in self.proteins]
+        chunk_size = chunk_size or max(len(identifiers), 1)
+        starts = range(0, max(len(identifiers), 1), chunk_size)
+        chunks = await asyncio.gather(*[client.run(self._string_request, 'get_string_ids',
+                                                   identifiers[start:start + chunk_size],
+                                                   function=client.get_string_ids) for start in starts])
+        for start, chunk in zip(starts, chunks):
+            if 'queryIndex' in chunk.columns:
+                chunk['queryIndex'] += start
+        self.genes_mapped = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+        self.nomapped_genes, self.overmapped_genes = self._find_nomapped_genes()
 
-    def prioretizingGO(self, terms: [list, set], organism='Human', domain='BP'):
+    async def aget_enrichment(self, client=None):
+        """
+        asyncio version of 'get_enrichment' (backend='string'). Results store in self.enrichment
+        :param client: AsyncSTRINGClient object shared between analyses (see 'STRING_requests' module).
+                       By default, new client is made for this call
+        :return: None
+        """
+        if client is None:
+            async with AsyncSTRINGClient() as client:
+                return await self.aget_enrichment(client=client)
+
+        enrichment = await client.run(self._string_request, 'get_enrichment', self.genes_mapped.queryItem,
+                                      function=client.get_enrichment)
+        enrichment['enrich_score'] = np.round(-np.log2(enrichment.fdr.to_numpy(dtype=float)), 1) #get enrichment score
+        self.enrichment = enrichment
+
+    @instrumented
+    def prioretizingGO(self, terms: [list, set], organism='Human', domain='BP', worker=None, backend='R',
+                       go_dag=None):
         """
         function for prioretizing GO-terms using R script with GOxploreR package (doi:10.1038/s41598-020-73326-3)
         See 'RScript Prioretizing_GO.R'
@@ -286,11 +809,21 @@ class EnrichmentAnalysis:
         If you use this function in google-collab, you will have to install R-packages at the first launch.
         This may take a long time (up to 20 minutes)
 
+        For repeated prioritizations use persistent R worker: worker = RWorker() (see 'R_requests' module).
+        It loads R-packages once, so next calls cost only GOxploreR computation
+
+        backend='python' prioretizes terms without R by GO-DAG loaded from OBO file: go_dag = GODag('go-basic.obo')
+        (see 'GO_dag' module). It drops terms that are ancestors of other input terms and ranks remaining terms
+        by level in GO-DAG. GO-DAG is common for all organisms, so 'organism' isn`t used by this backend
+
         :param terms: list of GO-terms
         :param organism: name of target organism
         :param domain: name of domain in GO-graph. Available inputs: 'BP' - Biological Process
 			            											 'CC' - Cellular Component
             														 "MF" - Molecular Functions
+        :param worker: work with backend='R', RWorker object. None - new R process is started for this request
+        :param backend: 'R' - prioritization by GOxploreR, 'python' - prioritization by GODag
+        :param go_dag: work with backend='python', GODag object
         :return: list of Prioretized GO terms
         """
         valid_organisms = {"Homo Sapiens", "Human", "Rattus Norvegicus", "Rat", "Mus Musculus", "Mouse",
@@ -299,37 +832,49 @@ class EnrichmentAnalysis:
                            "Fission Yeast", "Drosophila Melanogaster", "Fruit Fly", "Escherichia Coli", "E.Coli"}
         Check_Value(organism, valid_organisms, 'organism')
         Check_Value(domain, {'BP', 'MF', 'CC'}, 'domain')
+        Check_Value(backend, {'R', 'python'}, 'backend')
+
+        if backend == 'python':
+            if go_dag is None:
+                raise Exception('Python backend needs GO-DAG. Load it by GODag("go-basic.obo")')
+            return go_dag.prioritize(terms, domain=domain)
+        if worker is not None:
+            return worker.prioritize(terms, organism=organism, domain=domain)
 
         installing = Check_R_packages(CRAN_packages=["GOxploreR", "data.table", "BiocManager", "utils", "ggplot2"],
                          BiocManager_packages=["GO.db", "annotate", "biomaRt"])
 
-        self.save_table(pd.DataFrame(terms, columns=['Term']), 'input_priority_terms.csv', saveformat='csv', index=False)
-
-        # Request to CMD to execute RScript
-        command = 'Rscript'
-        path2script = os.path.join(RSCRIPTS_PATH, 'Prioretizing_GO.R')
-        path2file = os.path.abspath('input_priority_terms.csv')
-
-        # Variable number of args in a list
-        args = [path2file, 'Human', 'BP']
-        # Build subprocess command
-        cmd = [command, path2script] + args
-        # check_output will run the command and store to result
-        p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
-        output, error = p.communicate()
-
-        # PRINT R CONSOLE OUTPUT (ERROR OR NOT)
-        if p.returncode == 0:
-            if installing:
-                print('All R-packages were installed successfully')
-            s_output = short_R_output(output.decode("utf8")) # if all is OK, then makes short output
-            print(f'R OUTPUT:\n {s_output}')
-        else:
-            print(f'R ERROR:\n {error.decode("utf8")}')
+        with tempfile.TemporaryDirectory() as temp_dir: # per-request files, so concurrent calls don`t mix
+            path2file = os.path.join(temp_dir, 'input_priority_terms.csv')
+            pd.DataFrame(terms, columns=['Term']).to_csv(path2file, index=False)
+
+            # Request to CMD to execute RScript
+            command = 'Rscript'
+            path2script = os.path.join(RSCRIPTS_PATH, 'Prioretizing_GO.R')
+
+            # Variable number of args in a list
+            args = [path2file, organism, domain]
+            # Build subprocess command
+            cmd = [command, path2script] + args
+            # check_output will run the command and store to result
+            with measure('Rscript.Prioretizing_GO', kind='subprocess', rows_in=len(terms)) as event:
+                p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+                output, error = p.communicate()
+                event['returncode'] = p.returncode
+
+            # PRINT R CONSOLE OUTPUT (ERROR OR NOT)
+            if p.returncode == 0:
+                if installing:
+                    echo('All R-packages were installed successfully')
+                s_output = short_R_output(output.decode("utf8")) # if all is OK, then makes short output
+                echo(f'R OUTPUT:\n {s_output}')
+            else:
+                echo(f'R ERROR:\n {error.decode("utf8")}')
 
-        prior_terms = pd.read_csv(os.path.abspath('output_priority_terms.csv'))
+            prior_terms = pd.read_csv(os.path.join(temp_dir, 'output_priority_terms.csv'))
         return list(prior_terms.Term)
 
+    @instrumented
     def proteins_participation_in_the_category(self, df, category, term_type='id', term_sep='\n'):
         """
         function check terms that proteins participated and make statistics table
@@ -346,14 +891,25 @@ class EnrichmentAnalysis:
         Check_Value(category, valid_category, 'category')
         Check_Value(term_type, {'description', 'id'}, 'term_type')
 
-        prot_participation = pd.DataFrame(columns=[self.protein_id_type, 'number_of_terms', 'terms'])
-        sub_df_category = df[df.category == category]
-        for prot in self.proteins:
-            prot_participation.loc[len(prot_participation)] = {
-                self.protein_id_type: prot,
-                'number_of_terms': len(sub_df_category[sub_df_category.inputGenes.str.contains(prot)]),
-                'terms': sub_df_category[d_term[term_type]][sub_df_category.inputGenes.str.contains(prot)].apply(
-                    lambda x: str(x) + term_sep).sum()}
+        # incidence proteins x terms of chosen category
+        if df is self.enrichment:
+            columns = self._category_rows[category]
+        else:
+            columns = np.flatnonzero((df.category == category).to_numpy())
+        genes, matrix = self._get_incidence(df)
+        # extra empty row for proteins which are absent in enrichment table
+        category_matrix = sparse.vstack([matrix[:, columns].tocsr(),
+                                         sparse.csr_matrix((1, len(columns)), dtype=bool)]).tocsr()
+        rows = genes.get_indexer(self.proteins)
+        sub_matrix = category_matrix[np.where(rows >= 0, rows, len(genes))]
+        sub_matrix.sort_indices()
+
+        labels = df[d_term[term_type]].iloc[columns].astype(str).to_numpy() + term_sep
+        indptr, indices = sub_matrix.indptr, sub_matrix.indices
+        prot_participation = pd.DataFrame({
+            self.protein_id_type: self.proteins.to_numpy(),
+            'number_of_terms': np.diff(indptr),
+            'terms': [''.join(labels[indices[indptr[i]:indptr[i + 1]]]) for i in range(len(rows))]})
 
         prot_participation.sort_values('number_of_terms', ascending=False, inplace=True)
         return prot_participation
@@ -377,17 +933,7 @@ class EnrichmentAnalysis:
         Check_Value(category, valid_category, 'category')
         Check_Value(sort_by, {'genes', 'term'}, 'sort_by')
 
-        table = []
-        category_data = self.enrichment[self.enrichment.category == category]
-        terms = self.get_category_terms(category, term_type='description')
-        for term in terms:
-            string = category_data[category_data.description == term]
-            table.append([term, list(string.number_of_genes)[0]])
-        df = pd.DataFrame(table, columns=['Term', '# Genes'])
-        if sort_by == 'genes':
-            df.sort_values('# Genes', ascending = False, inplace=True)
-        elif sort_by == 'term':
-            df.sort_values('Term', ascending = True, inplace=True)
+        df = self._get_category_terms_table(category, sort_by)
         if show == 'all':
             display_df(df)
         else:
@@ -404,11 +950,11 @@ class EnrichmentAnalysis:
         function shown available enrichment categories for current dataset
         :return: None
         """
-        table = []
-        for term in self.enrichment.category.unique():
-            table.append([term, len(self.enrichment[self.enrichment.category == term])])
-        print(tabulate(table, headers=['Category', 'Number of terms'], tablefmt='orgtbl'))
+        table = [[category, len(rows)] for category, rows in self._category_rows.items()]
+        if not is_quiet():
+            echo(tabulate(table, headers=['Category', 'Number of terms'], tablefmt='orgtbl'))
 
+    @instrumented
     def show_enrichest_terms_in_category(self, category: str, count: int = 10, sort_by='fdr',
                                          save: bool = False, savename='enrichment', saveformat='xlsx'):
         """
@@ -424,17 +970,228 @@ class EnrichmentAnalysis:
         Check_Value(category, valid_category, 'category')
         Check_Value(sort_by, {'fdr', 'p_value', 'number_of_genes'}, 'sort_by')
 
-        table = self.enrichment[self.enrichment.category == category].sort_values(by=sort_by)
+        table = self._get_sorted_category_data(category, sort_by).copy()
         if save:
             if savename == 'enrichment':
                 savename += '_' + category + '_' + datetime.now().strftime('%m-%d-%Y')
             self.save_table(table.head(count), savename, saveformat=saveformat, index=False)
-        print(f'ENRICHEST TERMS IN CATEGORY "{category}"')
-        display_df(table.head(count).drop(['number_of_genes_in_background', 'ncbiTaxonId', 'preferredNames', 'p_value'], axis=1))
+        if not is_quiet():
+            echo(f'ENRICHEST TERMS IN CATEGORY "{category}"')
+            display_df(table.head(count).drop(['number_of_genes_in_background', 'ncbiTaxonId', 'preferredNames', 'p_value'], axis=1))
         return table
 
 
+    @classmethod
+    @instrumented
+    def from_file(cls, path, protein_id_type='UniProtID', sep=None, chunksize: int = 100000,
+                  drop_duplicates: bool = True, cache=None):
+        """
+        function streams csv/tsv file (can be compressed, for example .gz) by chunks and keeps only "Gene" and
+        "UniProtID" columns, so memory is bounded by number of unique proteins, not by size of file
+        :param path: path to file
+        :param protein_id_type: type of protein ID. Valid Types
+        :param sep: separator of columns. By default, tab for .tsv/.tab/.txt files and comma for others
+        :param chunksize: number of rows read at once
+        :param drop_duplicates: drop duplicated proteins while reading (like 'drop_duplicated_genes', first entry is kept)
+        :param cache: STRINGCache object
+        :return: EnrichmentAnalysis
+        """
+        if sep is None:
+            name = path[:-3] if path.endswith('.gz') else path
+            sep = '\t' if os.path.splitext(name)[1] in {'.tsv', '.tab', '.txt'} else ','
+        header = pd.read_csv(path, sep=sep, nrows=0).columns
+        id_columns = [c for c in header if c in cls.types]
+        if len(id_columns) == 0:
+            raise Exception('The protein data must contain either a "Gene" or "UniProtID" column')
+        subset = protein_id_type if protein_id_type in id_columns else id_columns[0]
+
+        chunks, seen = [], set()
+        n_rows = 0
+        for chunk in pd.read_csv(path, sep=sep, usecols=id_columns, dtype=str, chunksize=chunksize):
+            n_rows += len(chunk)
+            if drop_duplicates:
+                chunk = chunk[~chunk[subset].duplicated() & ~chunk[subset].isin(seen)]
+                seen.update(chunk[subset])
+            chunks.append(chunk)
+        data = pd.concat(chunks) if len(chunks) else pd.DataFrame(columns=id_columns)
+        if drop_duplicates:
+            echo(f'{n_rows - len(data)} of {n_rows} genes was dropped from original set')
+        return cls(data[id_columns], protein_id_type=protein_id_type, cache=cache)
+
+    @instrumented
+    def save_analysis(self, path, saveformat='parquet'):
+        """
+        function saves analysis in directory: enrichment table partitioned by category (one subdirectory per
+        category), table of mapped genes, original data and parameters of analysis. Reopen it by 'load_analysis'
+        :param path: path to directory
+        :param saveformat: 'parquet' or 'feather' (feather files are memory-mapped when analysis is loaded)
+        :return: None
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        Check_Value(saveformat, {'parquet', 'feather'}, 'saveformat')
+        os.makedirs(path, exist_ok=True)
+        # analysis.json is written the last, so directory isn`t loadable until all tables are saved. Errors of
+        # writing tables are raised (not only printed as in 'save_table')
+        if os.path.exists(os.path.join(path, 'analysis.json')):
+            os.remove(os.path.join(path, 'analysis.json'))
+        shutil.rmtree(os.path.join(path, 'enrichment'), ignore_errors=True) # drop partitions of previous saving
+
+        def write(name, table):
+            name = os.path.join(path, f'{name}.{saveformat}')
+            if saveformat == 'feather':
+                table.reset_index(drop=True).to_feather(name)
+            else:
+                table.to_parquet(name, index=False)
+
+        if self.enrichment is not None:
+            enrichment = pa.Table.from_pandas(self.enrichment.assign(category=self.enrichment.category.astype(str)),
+                                              preserve_index=False)
+            ds.write_dataset(enrichment, os.path.join(path, 'enrichment'), format=saveformat,
+                             partitioning=['category'], partitioning_flavor='hive')
+        write('data', self.orig_data)
+        if hasattr(self, 'genes_mapped'):
+            write('genes_mapped', self.genes_mapped)
+        with open(os.path.join(path, 'analysis.json'), 'w') as f:
+            json.dump({'protein_id_type': self.protein_id_type, 'species': self.species, 'format': saveformat,
+                       'enrichment_columns': None if self.enrichment is None else list(self.enrichment.columns)}, f)
+
+    def _get_mapping_summary(self):
+        """
+        function makes mapping table of input proteins (see 'save_report')
+        :return: DataFrame with columns protein_id_type, 'mapped', 'number_of_matches', 'stringId', 'preferredName'
+                 (several matches are comma separated)
+        """
+        proteins = pd.Index(self.proteins.drop_duplicates())
+        key = self.types[self.protein_id_type]
+        matches = self.genes_mapped.loc[self.genes_mapped[key].isin(proteins), [key, 'stringId', 'preferredName']]
+        several = matches[key].duplicated(keep=False).to_numpy() # only these matches need joining
+        joined = matches[several].astype(str).groupby(key, sort=False).agg(','.join)
+        summary = pd.concat([matches[~several].set_index(key), joined]).reindex(proteins)
+        summary.insert(0, 'number_of_matches', matches[key].value_counts().reindex(proteins).to_numpy())
+        summary['number_of_matches'] = summary.number_of_matches.fillna(0).astype(int)
+        summary.insert(0, 'mapped', summary.number_of_matches > 0)
+        return summary.rename_axis(self.protein_id_type).reset_index()
+
+    @instrumented
+    def save_report(self, path, saveformat='xlsx', categories: list = None, sort_by='fdr', count: int = None):
+        """
+        function exports full report in one pass over enrichment table: sheets (or files) 'summary', 'mapping'
+        (see 'get_mapped'), one sheet per category with terms sorted by %sort_by and 'participation' (number of
+        terms of each category per protein, see 'proteins_participation_in_the_category'). Enrichment table is sorted
+        once, then categories are written one by one, so memory doesn`t grow with number of categories.
+        xlsx report is written by xlsxwriter in constant_memory mode
+        :param path: 'xlsx' - path to workbook, 'csv' and 'parquet' - path to directory of files <sheet>.<saveformat>
+        :param saveformat: 'xlsx', 'csv' or 'parquet'
+        :param categories: list of categories to export. None - all categories
+        :param sort_by: 'fdr', 'p_value' or 'number_of_genes' (ascending, like 'show_enrichest_terms_in_category')
+        :param count: number of top terms of each category. None - all terms
+        :return: None
+        """
+        Check_Value(saveformat, {'xlsx', 'csv', 'parquet'}, 'saveformat')
+        Check_Value(sort_by, {'fdr', 'p_value', 'number_of_genes'}, 'sort_by')
+        if self.enrichment is None:
+            raise Exception('Enrichment table is empty. Call "get_enrichment" first')
+        if categories is None:
+            categories = list(self._category_rows)
+        for category in categories:
+            Check_Value(category, self._get_valid_category(), 'category')
+
+        if saveformat == 'xlsx':
+            import xlsxwriter
+            if not path.endswith('.xlsx'):
+                path += '.xlsx'
+            workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'nan_inf_to_errors': True,
+                                                  'strings_to_urls': False})
+            write = functools.partial(write_sheet, workbook)
+        else:
+            os.makedirs(path, exist_ok=True)
+            def write(name, table):
+                name = os.path.join(path, f'{safe_name(name)}.{saveformat}')
+                if saveformat == 'csv':
+                    table.to_csv(name, index=False)
+                else:
+                    table.to_parquet(name, index=False)
+
+        try:
+            summary = [('proteins', len(self.proteins)), ('unique proteins', self.proteins.nunique())]
+            mapping = self._get_mapping_summary() if hasattr(self, 'genes_mapped') else None
+            if mapping is not None:
+                nomapped, overmapped = self._find_nomapped_genes() # genes_mapped can be set without 'get_mapped'
+                summary += [('mapped proteins', int(mapping.mapped.sum())),
+                            ('nomapped proteins', len(nomapped)),
+                            ('overmapped proteins', len(overmapped))]
+            summary += [(f'terms of {category}', len(self._category_rows[category])) for category in categories]
+            write('summary', pd.DataFrame(summary, columns=['parameter', 'value']))
+            if mapping is not None:
+                write('mapping', mapping)
+                del mapping
+
+            # one stable sort by (category, sort_by), then every category is contiguous slice of positions
+            codes = self.enrichment.category.cat.codes.to_numpy()
+            order = np.lexsort((self.enrichment[sort_by].to_numpy(), codes))
+            bounds = np.searchsorted(codes[order], np.arange(len(self.enrichment.category.cat.categories) + 1))
+            participation = {}
+            for category in categories:
+                code = self.enrichment.category.cat.categories.get_loc(category)
+                table = self.enrichment.iloc[order[bounds[code]:bounds[code + 1]]]
+                genes = ','.join(table.inputGenes.fillna('').astype(str)).split(',')
+                participation[category] = pd.Series(genes).value_counts()
+                write(category, table if count is None else table.head(count))
+
+            counts = pd.DataFrame(participation, columns=categories).reindex(self.proteins.to_numpy())
+            counts = counts.fillna(0).astype(int)
+            counts.insert(0, 'number_of_terms', counts.sum(axis=1))
+            counts = counts.rename_axis(self.protein_id_type).reset_index()
+            write('participation', counts.sort_values('number_of_terms', ascending=False, kind='stable'))
+        finally:
+            if saveformat == 'xlsx':
+                workbook.close()
+
+    @classmethod
+    @instrumented
+    def load_analysis(cls, path, categories: list = None, columns: list = None, cache=None):
+        """
+        function loads analysis saved by 'save_analysis'. Only chosen categories and columns of enrichment table are
+        read from disk, feather files are memory-mapped
+        :param path: path to directory
+        :param categories: list of categories of enrichment table to load. None - all categories
+        :param columns: list of columns of enrichment table to load. None - all columns
+        :param cache: STRINGCache object
+        :return: EnrichmentAnalysis
+        """
+        import pyarrow.dataset as ds
+        import pyarrow.feather as feather
+
+        with open(os.path.join(path, 'analysis.json')) as f:
+            meta = json.load(f)
+        saveformat = meta['format']
+
+        def read_table(name):
+            filename = os.path.join(path, f'{name}.{saveformat}')
+            if saveformat == 'feather':
+                return feather.read_table(filename, memory_map=True).to_pandas()
+            return pd.read_parquet(filename)
+
+        ea = cls(read_table('data'), protein_id_type=meta['protein_id_type'], cache=cache)
+        ea.species = meta['species']
+        if os.path.exists(os.path.join(path, f'genes_mapped.{saveformat}')):
+            ea.genes_mapped = read_table('genes_mapped')
+            ea.nomapped_genes, ea.overmapped_genes = ea._find_nomapped_genes()
+
+        if os.path.isdir(os.path.join(path, 'enrichment')):
+            dataset = ds.dataset(os.path.join(path, 'enrichment'), format=saveformat, partitioning='hive')
+            if columns is not None:
+                columns = ['category'] + [c for c in columns if c != 'category']
+            row_filter = None if categories is None else ds.field('category').isin(list(categories))
+            enrichment = dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+            order = [c for c in meta['enrichment_columns'] if c in enrichment.columns] # partition column back in place
+            ea.enrichment = enrichment[order]
+        return ea
+
     @staticmethod
+    @instrumented
     def create_subframe_by_names(df, column: str, names: [list, tuple, set], add: str = 'first'):
         """
         function finds rows in original dataset and returns sub-dataframe including input names in selected column
@@ -446,50 +1203,53 @@ class EnrichmentAnalysis:
                     'first' - add only the first entry
                     'last' - add only the last entry
                     'all' - add all entries
-        :return: sub-dataframe including input names in selected column
+        :return: sub-dataframe including input names in selected column. Rows follow the order of names.
+                 List of names which were not found is stored in new_df.attrs['not_found_names']
         """
-        Check_Value(add, {'first', 'last', 'all'}, add)
-
-        def add_all(table, rows):
-            return pd.concat([table, rows])
-
-        def add_first(table, rows):
-            table.loc[len(table)] = rows.iloc[0]
-            return table
-
-        def add_last(table, rows):
-            table.loc[len(table)] = rows.iloc[-1]
-            return table
-
-        adding_method = {'first': add_first,
-                         'last': add_last,
-                         'all': add_all}
-
-        new_df = pd.DataFrame(columns=df.columns)
-        not_found_names = []
-        for name in names:
-            rows = df[df[column] == name]
-            if len(rows) > 0:
-                new_df = adding_method[add](new_df, rows)
-            else: not_found_names.append(name)
-        print(f'{len(not_found_names)} names were not found in the dataframe:\n')
-        print('[', end='')
-        print(*not_found_names, sep=', ', end='')
-        print(']')
+        Check_Value(add, {'first', 'last', 'all'}, 'add')
+        names = pd.Series(list(names), dtype=object)
+
+        # positions of rows grouped by value of column: rows of value i are order[starts[i]:starts[i] + counts[i]]
+        codes, uniques = pd.factorize(df[column])
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        starts = np.r_[0, np.cumsum(counts)[:-1]].astype(int) + (codes < 0).sum()
+
+        name_codes = pd.Index(uniques).get_indexer(names)
+        found = name_codes >= 0
+        name_codes = name_codes[found]
+        if add == 'first':
+            positions = order[starts[name_codes]]
+        elif add == 'last':
+            positions = order[starts[name_codes] + counts[name_codes] - 1]
+        else:
+            lengths = counts[name_codes]
+            offsets = np.repeat(starts[name_codes] - np.r_[0, np.cumsum(lengths)[:-1]].astype(int), lengths)
+            positions = order[offsets + np.arange(lengths.sum())]
+
+        new_df = df.iloc[positions]
+        if add != 'all':
+            new_df = new_df.reset_index(drop=True)
+        not_found_names = names[~found].to_list()
+        new_df.attrs['not_found_names'] = not_found_names
+        echo(f'{len(not_found_names)} names were not found in the dataframe\n')
+        if 0 < len(not_found_names) < 80:
+            echo('List of not found names:\n', not_found_names)
 
         return new_df
 
     @staticmethod
+    @instrumented
     def save_table(table, name, saveformat='xlsx', index:bool = True):
         """
         function for saving DataFrame tables
         :param table: DataFrame
         :param name: name of file
-        :param saveformat: format of saving file: 'xlsx' or 'csv'
+        :param saveformat: format of saving file: 'xlsx', 'csv', 'parquet' or 'feather' (columnar formats keep dtypes)
         :param index: show indexes in saved table?
-        :return:
+        :return: None. Errors of saving are raised (also in quiet mode)
         """
-        Check_Value(saveformat, {'csv', 'xlsx'}, 'saveformat')
+        Check_Value(saveformat, {'csv', 'xlsx', 'parquet', 'feather'}, 'saveformat')
         try:
             if saveformat == 'xlsx':
                 if name[-5:] != '.xlsx' and name[-4:] != '.xls':
@@ -499,8 +1259,18 @@ class EnrichmentAnalysis:
                 if name[-4:] != '.csv':
                     name += '.csv'
                 table.to_csv(name, index=index, header=True)
-            print(f'File {name} successfully saved in {os.path.abspath(os.getcwd())}\n')
-        except PermissionError:
-            print('Permission Denied Error: Access is denied. Close file if it`s open and try again')
-        except:
-            print('Saving file isn`t complete. If you rewrite file, close it and try again')
\ No newline at end of file
+            elif saveformat == 'parquet':
+                if name[-8:] != '.parquet':
+                    name += '.parquet'
+                table.to_parquet(name, index=index)
+            elif saveformat == 'feather':
+                if name[-8:] != '.feather':
+                    name += '.feather'
+                (table.reset_index() if index else table.reset_index(drop=True)).to_feather(name)
+            echo(f'File {name} successfully saved in {os.path.abspath(os.getcwd())}\n')
+        except PermissionError as e:
+            raise Exception(f'Permission Denied Error: Access to {name} is denied. '
+                            f'Close file if it`s open and try again') from e
+        except Exception as e:
+            raise Exception(f'Saving file {name} isn`t complete ({e}). If you rewrite file, close it and try again') \
+                from e
\ No newline at end of file
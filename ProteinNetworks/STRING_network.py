@@ -0,0 +1,155 @@
+import numpy as np
+import os
+import pandas as pd
+from   scipy import sparse
+from   scipy.sparse import csgraph
+
+
+class ProteinNetwork:
+    """
+    Protein-protein interaction network stored as sparse symmetric CSR adjacency matrix with STRING combined scores.
+    Build it from STRING '<species>.protein.links.<version>.txt.gz' file by 'from_links', save arrays by 'save' and
+    reopen them memory-mapped by 'load'
+    """
+
+    def __init__(self, nodes, adjacency):
+        """
+        ProteinNetwork class constructor.
+        :param nodes: list of protein IDs (STRING ids), nodes of network
+        :param adjacency: sparse symmetric matrix nodes x nodes with scores of interactions
+        """
+        self.nodes = pd.Index(nodes)
+        self.adjacency = sparse.csr_matrix(adjacency)
+
+    @classmethod
+    def from_links(cls, path, min_score: int = 400, chunksize: int = 1000000):
+        """
+        function loads STRING links file (columns: protein1, protein2, combined_score and optionally other scores).
+        File is read by chunks, only links with combined_score >= min_score are kept
+        :param path: path to '<species>.protein.links(.detailed|.full).<version>.txt(.gz)' file
+        :param min_score: minimal combined score of interaction (from 0 to 1000). STRING medium confidence is 400
+        :param chunksize: number of rows read at once
+        :return: ProteinNetwork
+        """
+        nodes = pd.Index([], dtype=object)
+        rows, columns, scores = [], [], []
+        for chunk in pd.read_csv(path, sep=' ', chunksize=chunksize,
+                                 dtype={'protein1': str, 'protein2': str, 'combined_score': np.int16}):
+            chunk = chunk[chunk.combined_score >= min_score]
+            names = pd.unique(np.concatenate([chunk.protein1.to_numpy(), chunk.protein2.to_numpy()]))
+            nodes = nodes.append(pd.Index(names).difference(nodes, sort=False))
+            rows.append(nodes.get_indexer(chunk.protein1).astype(np.int32))
+            columns.append(nodes.get_indexer(chunk.protein2).astype(np.int32))
+            scores.append(chunk.combined_score.to_numpy(dtype=np.int16))
+
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int32)
+        columns = np.concatenate(columns) if columns else np.empty(0, dtype=np.int32)
+        scores = np.concatenate(scores) if scores else np.empty(0, dtype=np.int16)
+        adjacency = sparse.csr_matrix((scores, (rows, columns)), shape=(len(nodes), len(nodes)))
+        adjacency = adjacency.maximum(adjacency.T).tocsr() # links can be listed in one direction only
+        return cls(nodes, adjacency)
+
+    def save(self, path) -> None:
+        """
+        function saves arrays of network in directory as .npy files
+        :param path: path to directory
+        :return: None
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'nodes.npy'), self.nodes.to_numpy().astype(str))
+        np.save(os.path.join(path, 'indptr.npy'), self.adjacency.indptr)
+        np.save(os.path.join(path, 'indices.npy'), self.adjacency.indices)
+        np.save(os.path.join(path, 'scores.npy'), self.adjacency.data)
+
+    @classmethod
+    def load(cls, path, mmap: bool = True):
+        """
+        function loads network saved by 'save'
+        :param path: path to directory
+        :param mmap: memory-map arrays instead of reading them in memory
+        :return: ProteinNetwork
+        """
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode)
+                  for name in ('nodes', 'indptr', 'indices', 'scores')}
+        n = len(arrays['nodes'])
+        adjacency = sparse.csr_matrix((arrays['scores'], arrays['indices'], arrays['indptr']), shape=(n, n),
+                                      copy=False)
+        return cls(np.asarray(arrays['nodes']).astype(object), adjacency)
+
+    def _positions(self, proteins):
+        """
+        function returns positions of proteins in network (proteins absent in network are skipped)
+        :param proteins: list of protein IDs
+        :return: numpy array of positions
+        """
+        positions = self.nodes.get_indexer(pd.Index(pd.unique(np.asarray(list(proteins), dtype=object))))
+        return positions[positions >= 0]
+
+    def subnetwork(self, proteins, min_score: int = None):
+        """
+        function extracts subnetwork induced by proteins
+        :param proteins: list of protein IDs (STRING ids)
+        :param min_score: minimal score of interaction in subnetwork. None - all interactions of network
+        :return: ProteinNetwork
+        """
+        positions = self._positions(proteins)
+        adjacency = self.adjacency[positions][:, positions]
+        if min_score is not None:
+            adjacency.data[adjacency.data < min_score] = 0
+            adjacency.eliminate_zeros()
+        return ProteinNetwork(self.nodes[positions], adjacency)
+
+    def degree(self) -> pd.Series:
+        """
+        function returns number of interactions of each protein
+        :return: Series {protein: degree} sorted by descending
+        """
+        degree = pd.Series(np.diff(self.adjacency.indptr), index=self.nodes, name='degree')
+        return degree.sort_values(ascending=False, kind='stable')
+
+    def connected_components(self) -> pd.Series:
+        """
+        function finds connected components of network. Components are numbered by size (0 - the largest)
+        :return: Series {protein: number of component}
+        """
+        n_components, labels = csgraph.connected_components(self.adjacency, directed=False)
+        sizes = np.bincount(labels, minlength=n_components)
+        rank = np.empty(n_components, dtype=int)
+        rank[np.argsort(-sizes, kind='stable')] = np.arange(n_components)
+        return pd.Series(rank[labels], index=self.nodes, name='component')
+
+    def neighborhood(self, proteins, k: int = 1, min_score: int = None) -> list:
+        """
+        function finds proteins within k interactions from input proteins (input proteins are included).
+        Breadth-first search reads only rows of adjacency of reached proteins, so adjacency isn`t copied
+        :param proteins: list of protein IDs
+        :param k: number of steps
+        :param min_score: minimal score of interactions used for steps. None - all interactions of network
+        :return: list of protein IDs
+        """
+        indptr, indices, scores = self.adjacency.indptr, self.adjacency.indices, self.adjacency.data
+        reached = np.zeros(len(self.nodes), dtype=bool)
+        frontier = self._positions(proteins)
+        reached[frontier] = True
+        for _ in range(k):
+            # positions of all interactions of frontier proteins in 'indices'
+            starts, lengths = indptr[frontier], indptr[frontier + 1] - indptr[frontier]
+            links = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+            if min_score is not None:
+                links = links[scores[links] >= min_score]
+            neighbors = np.unique(indices[links])
+            frontier = neighbors[~reached[neighbors]]
+            if len(frontier) == 0:
+                break
+            reached[frontier] = True
+        return self.nodes[reached].to_list()
+
+    def edges(self) -> pd.DataFrame:
+        """
+        function returns table of interactions (each interaction once)
+        :return: DataFrame with columns 'protein1', 'protein2', 'score'
+        """
+        upper = sparse.triu(self.adjacency, k=1).tocoo()
+        return pd.DataFrame({'protein1': self.nodes[upper.row], 'protein2': self.nodes[upper.col],
+                             'score': upper.data})
@@ -0,0 +1,213 @@
+from   .instrumentation import measure
+
+import asyncio
+from   concurrent.futures import ThreadPoolExecutor
+import functools
+import pandas as pd
+import requests
+from   requests.adapters import HTTPAdapter
+import stringdb
+import threading
+import time
+
+
+# root of STRING API. Change it to send requests to mirror or local server
+STRING_API_URL = 'https://string-db.org/api'
+CALLER_IDENTITY = 'https://github.com/gpp-rnd/stringdb'
+
+# errors of connection which are repeated by 'post_string_request'. HTTP errors are repeated only for RETRY_STATUSES
+# (too many requests) and 5xx statuses (errors of server), other 4xx statuses are permanent
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+RETRY_STATUSES = {429}
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter of requests rate. Every call of 'wait' blocks thread until next request is allowed
+    """
+
+    def __init__(self, rate: float = None):
+        """
+        RateLimiter class constructor.
+        :param rate: maximal number of requests per second. None - no limit
+        """
+        self.interval = 0 if not rate else 1 / rate
+        self._next_time = 0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        """
+        function blocks thread until next request is allowed
+        :return: None
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+def post_string_request(method: str, params: dict, api_url: str = None, retries: int = 3,
+                        backoff: float = 1, limiter: RateLimiter = None, session=None):
+    """
+    function sends POST request to STRING API method and returns table of results. Requests failed by connection
+    errors, timeouts, 429 or 5xx statuses are repeated with exponential backoff, other errors are raised at once
+    :param method: name of STRING API method. For example, 'get_string_ids'
+    :param params: parameters of request
+    :param api_url: root of STRING API. By default, STRING_API_URL
+    :param retries: number of repeats of failed request
+    :param backoff: pause before first repeat (in seconds). Every next pause is twice as long
+    :param limiter: RateLimiter object shared between threads
+    :param session: requests.Session object. By default, new connection is made
+    :return: DataFrame
+    """
+    request_url = '/'.join([(api_url or STRING_API_URL).rstrip('/'), 'tsv', method])
+    post = requests.post if session is None else session.post
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.wait()
+        try:
+            with measure(f'STRING.post.{method}', kind='network', attempt=attempt) as event:
+                response = post(request_url, data=params)
+                event['status'] = response.status_code
+        except RETRY_ERRORS:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+            continue
+        if (response.status_code in RETRY_STATUSES or response.status_code >= 500) and attempt < retries:
+            time.sleep(backoff * 2 ** attempt)
+            continue
+        if response.ok and len(response.content.strip()) == 0:  # nothing was found
+            return pd.DataFrame()
+        return stringdb.handle_results(response)
+
+
+def get_string_ids_batched(identifiers, species=9606, chunk_size: int = 2000, workers: int = 4, retries: int = 3,
+                           backoff: float = 1, rate_limit: float = None, api_url: str = None,
+                           caller_identity: str = CALLER_IDENTITY):
+    """
+    function maps identifiers to STRING ids like stringdb.get_string_ids, but splits identifiers into chunks and
+    sends them concurrently. 'queryIndex' column of result refers to position in whole identifiers list, so result
+    is the same as result of single request
+    :param identifiers: list of protein identifiers
+    :param species: ID of organism. For example, Human species=9606
+    :param chunk_size: number of identifiers in one request
+    :param workers: number of concurrent requests
+    :param retries: number of repeats of failed chunk request
+    :param backoff: pause before first repeat (in seconds). Every next pause is twice as long
+    :param rate_limit: maximal number of requests per second. None - no limit
+    :param api_url: root of STRING API. By default, STRING_API_URL
+    :param caller_identity: personal identifier for STRING
+    :return: DataFrame of mapped identifiers
+    """
+    identifiers = [str(i) for i in identifiers]
+    starts = range(0, len(identifiers), chunk_size)
+    limiter = RateLimiter(rate_limit)
+
+    with requests.Session() as session:
+        def map_chunk(start):
+            params = {'identifiers': '\r'.join(identifiers[start:start + chunk_size]), 'species': species,
+                      'limit': 1, 'echo_query': 1, 'caller_identity': caller_identity}
+            df = post_string_request('get_string_ids', params, api_url=api_url, retries=retries,
+                                     backoff=backoff, limiter=limiter, session=session)
+            if 'queryIndex' in df.columns:
+                df['queryIndex'] += start
+            return df
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            chunks = list(executor.map(map_chunk, starts))
+
+    if len(chunks) == 0:
+        return pd.DataFrame(columns=['queryIndex', 'queryItem', 'stringId', 'ncbiTaxonId', 'taxonName',
+                                     'preferredName', 'annotation'])
+    return pd.concat(chunks, ignore_index=True)
+
+
+class AsyncSTRINGClient:
+    """
+    Client for asyncio code (see 'EnrichmentAnalysis.aget_mapped' and 'EnrichmentAnalysis.aget_enrichment').
+    Requests are sent by pool of threads through one shared connection pool, number of simultaneous requests
+    is limited by 'concurrency'. Responses are parsed like in stringdb, so results are the same as results of
+    sync methods
+    """
+
+    def __init__(self, concurrency: int = 8, api_url: str = None, retries: int = 3, backoff: float = 1,
+                 rate_limit: float = None, caller_identity: str = CALLER_IDENTITY):
+        """
+        AsyncSTRINGClient class constructor.
+        :param concurrency: maximal number of simultaneous requests
+        :param api_url: root of STRING API. By default, STRING_API_URL
+        :param retries: number of repeats of failed request
+        :param backoff: pause before first repeat (in seconds). Every next pause is twice as long
+        :param rate_limit: maximal number of requests per second. None - no limit
+        :param caller_identity: personal identifier for STRING
+        """
+        self.concurrency = concurrency
+        self.api_url = api_url
+        self.retries = retries
+        self.backoff = backoff
+        self.caller_identity = caller_identity
+        self.limiter = RateLimiter(rate_limit)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphores = {} # semaphore of each event loop
+
+    def _post(self, method: str, params: dict):
+        """
+        function sends request by shared session (see 'post_string_request')
+        """
+        return post_string_request(method, params, api_url=self.api_url, retries=self.retries,
+                                   backoff=self.backoff, limiter=self.limiter, session=self.session)
+
+    def get_string_ids(self, identifiers, species=9606, limit=1, echo_query=1):
+        """
+        function maps identifiers to STRING ids. It has the same parameters and results as stringdb.get_string_ids
+        :return: DataFrame
+        """
+        params = {'identifiers': '\r'.join(identifiers), 'species': species, 'limit': limit,
+                  'echo_query': echo_query, 'caller_identity': self.caller_identity}
+        return self._post('get_string_ids', params)
+
+    def get_enrichment(self, identifiers, background_string_identifiers=None, species=9606):
+        """
+        function gets functional enrichment. It has the same parameters and results as stringdb.get_enrichment
+        :return: DataFrame
+        """
+        params = {'identifiers': '\r'.join(identifiers), 'species': species, 'caller_identity': self.caller_identity}
+        if background_string_identifiers is not None:
+            params['background_string_identifiers'] = '\r'.join(background_string_identifiers)
+        return self._post('enrichment', params)
+
+    async def run(self, function, /, *args, **kwargs):
+        """
+        function runs blocking function (for example, request) in pool of threads. Number of simultaneous calls
+        is limited by 'concurrency'
+        :param function: function
+        :param args: positional arguments of function
+        :param kwargs: keyword arguments of function
+        :return: result of function
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.setdefault(loop, asyncio.Semaphore(self.concurrency))
+        async with semaphore:
+            return await loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+
+    def close(self) -> None:
+        """
+        function closes connections and pool of threads
+        :return: None
+        """
+        self._executor.shutdown(wait=True)
+        self.session.close()
+        self._semaphores.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,3 +1,19 @@
 #from .STRING_enrichment import *
 #from .R_requests import *
-from . import STRING_enrichment, R_requests
\ No newline at end of file
+import importlib
+
+# submodules are imported by first access (ProteinNetworks.STRING_enrichment), so 'import ProteinNetworks' and
+# command-line tool (see 'cli') don`t load pandas, stringdb and other heavy packages until they are needed
+__all__ = ['STRING_enrichment', 'STRING_cache', 'STRING_requests', 'STRING_aliases', 'STRING_network',
+           'local_enrichment', 'batch_enrichment', 'enrichment_service', 'group_comparison', 'GO_dag', 'R_requests',
+           'instrumentation']
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
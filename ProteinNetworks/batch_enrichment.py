@@ -0,0 +1,151 @@
+from   .STRING_enrichment import EnrichmentAnalysis, Check_Value
+from   .STRING_requests import AsyncSTRINGClient
+
+import asyncio
+from   concurrent.futures import ProcessPoolExecutor
+import os
+import pandas as pd
+
+
+# annotation table of worker process. It`s loaded once per worker by '_init_worker'
+_WORKER_ANNOTATION = None
+
+
+def _init_worker(annotation):
+    """
+    function stores annotation table in worker process, so it isn`t sent with every cohort
+    :param annotation: AnnotationTable object or None
+    :return: None
+    """
+    global _WORKER_ANNOTATION
+    _WORKER_ANNOTATION = annotation
+
+
+def _enrich_cohort(task):
+    """
+    function performs enrichment analysis of one cohort in worker process
+    :param task: tuple (genes_mapped, protein_id_type, species, backend, background, cache)
+    :return: enrichment DataFrame
+    """
+    genes_mapped, protein_id_type, species, backend, background, cache = task
+    ea = EnrichmentAnalysis(pd.DataFrame({protein_id_type: genes_mapped.queryItem}),
+                            protein_id_type=protein_id_type, cache=cache)
+    ea.species = species
+    ea.genes_mapped = genes_mapped
+    ea.get_enrichment(backend=backend, annotation=_WORKER_ANNOTATION, background=background)
+    return ea.enrichment
+
+
+def _make_analyses(cohorts: dict, protein_id_type, cache):
+    """
+    function makes EnrichmentAnalysis object for each cohort
+    :param cohorts: dict {cohort name: DataFrame with "Gene" or "UniProtID" column or list of protein IDs}
+    :param protein_id_type: type of protein ID: 'UniProtID' or 'Gene'
+    :param cache: STRINGCache object
+    :return: dict {cohort name: EnrichmentAnalysis}
+    """
+    analyses = {}
+    for name, data in cohorts.items():
+        if not isinstance(data, pd.DataFrame):
+            data = pd.DataFrame({protein_id_type: list(data)})
+        analyses[name] = EnrichmentAnalysis(data, protein_id_type=protein_id_type, cache=cache)
+        if analyses[name].protein_id_type != protein_id_type:
+            raise Exception(f'Cohort "{name}" doesn`t contain "{protein_id_type}" column')
+    return analyses
+
+
+def map_cohorts(cohorts: dict, protein_id_type='UniProtID', species=9606, cache=None, chunk_size: int = None,
+                workers: int = 4):
+    """
+    function maps proteins of many cohorts. Unique proteins of all cohorts are mapped once, then mapping is split
+    between cohorts
+    :param cohorts: dict {cohort name: DataFrame with "Gene" or "UniProtID" column or list of protein IDs}
+    :param protein_id_type: type of protein ID: 'UniProtID' or 'Gene'
+    :param species: ID of organism. For example, Human species=9606
+    :param cache: STRINGCache object
+    :param chunk_size: chunk size of mapping (see 'EnrichmentAnalysis.get_mapped')
+    :param workers: work with chunk_size, number of concurrent requests
+    :return: dict {cohort name: EnrichmentAnalysis} with mapped genes
+    """
+    Check_Value(protein_id_type, set(EnrichmentAnalysis.types), 'protein_id_type')
+
+    analyses = _make_analyses(cohorts, protein_id_type, cache)
+
+    # map unique proteins of all cohorts by one request
+    all_proteins = pd.concat([ea.proteins for ea in analyses.values()], ignore_index=True).drop_duplicates()
+    union = EnrichmentAnalysis(pd.DataFrame({protein_id_type: all_proteins}), protein_id_type=protein_id_type,
+                               cache=cache)
+    union.get_mapped(species=species, chunk_size=chunk_size, workers=workers)
+
+    for ea in analyses.values():
+        ea.species = species
+        ea.genes_mapped = union.genes_mapped[union.genes_mapped.queryItem.isin(set(ea.proteins))]\
+            .reset_index(drop=True)
+        ea.nomapped_genes, ea.overmapped_genes = ea._find_nomapped_genes()
+    return analyses
+
+
+def enrich_cohorts(cohorts: dict, protein_id_type='UniProtID', species=9606, backend='string', annotation=None,
+                   background=None, workers: int = None, cache=None, chunk_size: int = None):
+    """
+    function performs enrichment analysis of many cohorts. Unique proteins of all cohorts are mapped once,
+    then cohorts are enriched in parallel by process pool. Annotation table is sent to each worker process once
+    :param cohorts: dict {cohort name: DataFrame with "Gene" or "UniProtID" column or list of protein IDs}
+    :param protein_id_type: type of protein ID: 'UniProtID' or 'Gene'
+    :param species: ID of organism. For example, Human species=9606
+    :param backend: 'string' - enrichment by STRING web service, 'local' - enrichment by local annotation table
+    :param annotation: work with backend='local', AnnotationTable object
+    :param background: work with backend='local', list of background genes
+    :param workers: number of worker processes. By default, number of CPUs
+    :param cache: STRINGCache object
+    :param chunk_size: chunk size of mapping (see 'EnrichmentAnalysis.get_mapped')
+    :return: (results, analyses) - long-form DataFrame of enrichment of all cohorts with 'cohort' column and
+             dict {cohort name: EnrichmentAnalysis}
+    """
+    Check_Value(protein_id_type, set(EnrichmentAnalysis.types), 'protein_id_type')
+    Check_Value(backend, {'string', 'local'}, 'backend')
+
+    analyses = map_cohorts(cohorts, protein_id_type=protein_id_type, species=species, cache=cache,
+                           chunk_size=chunk_size)
+    tasks = [(ea.genes_mapped, protein_id_type, species, backend, background, cache) for ea in analyses.values()]
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(annotation,)) as executor:
+        enrichments = list(executor.map(_enrich_cohort, tasks))
+
+    for ea, enrichment in zip(analyses.values(), enrichments):
+        ea.enrichment = enrichment
+    results = pd.concat([enrichment.assign(cohort=name) for name, enrichment in zip(analyses, enrichments)],
+                        ignore_index=True)
+    results.insert(0, 'cohort', results.pop('cohort'))
+    return results, analyses
+
+
+async def aenrich_cohorts(cohorts: dict, protein_id_type='UniProtID', species=9606, client=None,
+                          concurrency: int = 8, chunk_size: int = None, cache=None):
+    """
+    asyncio pipeline of many cohorts through mapping and enrichment by STRING web service. Every cohort is enriched
+    as soon as it`s mapped, so mapping of one cohort overlaps with enrichment of others
+    :param cohorts: dict {cohort name: DataFrame with "Gene" or "UniProtID" column or list of protein IDs}
+    :param protein_id_type: type of protein ID: 'UniProtID' or 'Gene'
+    :param species: ID of organism. For example, Human species=9606
+    :param client: AsyncSTRINGClient object. By default, new client with %concurrency simultaneous requests is made
+    :param concurrency: work without client, maximal number of simultaneous requests
+    :param chunk_size: chunk size of mapping (see 'EnrichmentAnalysis.aget_mapped')
+    :param cache: STRINGCache object
+    :return: dict {cohort name: EnrichmentAnalysis}
+    """
+    Check_Value(protein_id_type, set(EnrichmentAnalysis.types), 'protein_id_type')
+    if client is None:
+        async with AsyncSTRINGClient(concurrency=concurrency) as client:
+            return await aenrich_cohorts(cohorts, protein_id_type=protein_id_type, species=species, client=client,
+                                         chunk_size=chunk_size, cache=cache)
+
+    analyses = _make_analyses(cohorts, protein_id_type, cache)
+
+    async def process(ea):
+        await ea.aget_mapped(species=species, client=client, chunk_size=chunk_size)
+        await ea.aget_enrichment(client=client)
+
+    await asyncio.gather(*[process(ea) for ea in analyses.values()])
+    return analyses
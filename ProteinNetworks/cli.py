@@ -0,0 +1,192 @@
+"""
+Command-line tool for batch processing of directories of protein lists:
+
+    python -m ProteinNetworks map    INPUT_DIR OUTPUT_DIR    # tables of mapped genes
+    python -m ProteinNetworks enrich INPUT_DIR OUTPUT_DIR    # saved analyses (see 'EnrichmentAnalysis.save_analysis')
+    python -m ProteinNetworks export INPUT_DIR OUTPUT_DIR    # enrichment tables of saved analyses
+
+Only standard library is imported on start, pandas, stringdb and analysis modules are imported by commands, so
+'--help' is fast. Any error (including failed writing of output file) is printed to stderr and exit code is 1.
+"""
+import argparse
+import os
+import sys
+
+
+# extensions of input protein lists (files can be compressed, for example .csv.gz)
+INPUT_EXTENSIONS = ('.csv', '.tsv', '.tab', '.txt')
+
+
+def _input_files(input_dir) -> dict:
+    """
+    function finds protein lists in directory
+    :param input_dir: path to directory
+    :return: dict {name of file without extensions: path} sorted by name
+    """
+    if not os.path.isdir(input_dir):
+        raise Exception(f'Directory {input_dir} not found')
+    files = {}
+    for filename in sorted(os.listdir(input_dir)):
+        name = filename[:-3] if filename.endswith('.gz') else filename
+        stem, extension = os.path.splitext(name)
+        if extension in INPUT_EXTENSIONS:
+            files[stem] = os.path.join(input_dir, filename)
+    if not files:
+        raise Exception(f'Directory {input_dir} doesn`t contain {", ".join(INPUT_EXTENSIONS)} files')
+    return files
+
+
+def _read_cohorts(args) -> dict:
+    """
+    function reads protein lists of input directory
+    :param args: parsed arguments
+    :return: dict {cohort name: DataFrame with "Gene" and/or "UniProtID" columns}
+    """
+    from .STRING_enrichment import EnrichmentAnalysis
+
+    return {name: EnrichmentAnalysis.from_file(path, protein_id_type=args.id_type).orig_data
+            for name, path in _input_files(args.input_dir).items()}
+
+
+def _cache(args):
+    """
+    function opens STRING cache chosen by --cache option
+    :param args: parsed arguments
+    :return: STRINGCache object or None
+    """
+    if args.cache is None:
+        return None
+    from .STRING_cache import STRINGCache
+    return STRINGCache(args.cache)
+
+
+def run_map(args) -> None:
+    """
+    'map' command: proteins of all files are mapped once (by chunks of --chunk-size proteins, --workers
+    concurrent requests), table of mapped genes of each file is saved as OUTPUT_DIR/<name>.mapped.<format>
+    """
+    from .batch_enrichment import map_cohorts
+    from .STRING_enrichment import EnrichmentAnalysis
+
+    analyses = map_cohorts(_read_cohorts(args), protein_id_type=args.id_type, species=args.species,
+                           cache=_cache(args), chunk_size=args.chunk_size, workers=args.workers)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name, ea in analyses.items():
+        EnrichmentAnalysis.save_table(ea.genes_mapped, os.path.join(args.output_dir, f'{name}.mapped'),
+                                      saveformat=args.format, index=False)
+        print(f'{name}: {len(ea.genes_mapped)} of {len(ea.proteins)} proteins mapped')
+
+
+def run_enrich(args) -> None:
+    """
+    'enrich' command: files are mapped together, then enriched by --workers processes. Analysis of each file is
+    saved in OUTPUT_DIR/<name> directory (see 'EnrichmentAnalysis.save_analysis')
+    """
+    from .batch_enrichment import enrich_cohorts
+
+    annotation = None
+    if args.annotation is not None:
+        from .local_enrichment import AnnotationTable
+        annotation = AnnotationTable.from_string_terms(args.annotation, species=args.species)
+    backend = 'string' if annotation is None else 'local'
+
+    results, analyses = enrich_cohorts(_read_cohorts(args), protein_id_type=args.id_type, species=args.species,
+                                       backend=backend, annotation=annotation, workers=args.workers,
+                                       cache=_cache(args), chunk_size=args.chunk_size)
+    for name, ea in analyses.items():
+        ea.save_analysis(os.path.join(args.output_dir, name), saveformat=args.format)
+        print(f'{name}: {len(ea.enrichment)} enriched terms')
+
+
+def run_export(args) -> None:
+    """
+    'export' command: enrichment tables of analyses saved by 'enrich' command (subdirectories of INPUT_DIR) are
+    saved as OUTPUT_DIR/<name>.enrichment.<format>. Analyses are read by --workers threads
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from .STRING_enrichment import EnrichmentAnalysis
+
+    if not os.path.isdir(args.input_dir):
+        raise Exception(f'Directory {args.input_dir} not found')
+    names = sorted(name for name in os.listdir(args.input_dir)
+                   if os.path.exists(os.path.join(args.input_dir, name, 'analysis.json')))
+    if not names:
+        raise Exception(f'Directory {args.input_dir} doesn`t contain saved analyses')
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    def export(name):
+        ea = EnrichmentAnalysis.load_analysis(os.path.join(args.input_dir, name), categories=args.categories)
+        table = ea.enrichment
+        if table is None:
+            return name, 0
+        table = table[table.fdr <= args.fdr].sort_values(['category', 'fdr'], kind='stable')
+        EnrichmentAnalysis.save_table(table, os.path.join(args.output_dir, f'{name}.enrichment'),
+                                      saveformat=args.format, index=False)
+        return name, len(table)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for name, n_terms in executor.map(export, names):
+            print(f'{name}: {n_terms} terms exported')
+
+
+def make_parser() -> argparse.ArgumentParser:
+    """
+    function makes parser of command-line arguments
+    :return: ArgumentParser
+    """
+    parser = argparse.ArgumentParser(prog='python -m ProteinNetworks',
+                                     description='Batch mapping and enrichment analysis of directories of protein '
+                                                 'lists (csv/tsv files with "Gene" or "UniProtID" column)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_command(name, function, help, formats, default_format):
+        command = commands.add_parser(name, help=help, description=help)
+        command.set_defaults(function=function)
+        command.add_argument('input_dir', help='input directory')
+        command.add_argument('output_dir', help='output directory')
+        command.add_argument('--workers', type=int, default=4, help='number of workers (default: %(default)s)')
+        command.add_argument('--format', choices=formats, default=default_format,
+                             help='format of saved files (default: %(default)s)')
+        command.add_argument('-v', '--verbose', action='store_true', help='print messages and tables of analysis')
+        command.add_argument('--metrics', default=None, help='JSON-lines file for timing events of calls')
+        return command
+
+    map_command = add_command('map', run_map, 'map proteins to STRING ids', ['csv', 'xlsx', 'parquet', 'feather'],
+                              'csv')
+    enrich = add_command('enrich', run_enrich, 'map proteins and perform enrichment analysis',
+                         ['parquet', 'feather'], 'parquet')
+    enrich.add_argument('--annotation', default=None,
+                        help='STRING <species>.protein.enrichment.terms file for local enrichment '
+                             '(default: STRING web service)')
+    for command in (map_command, enrich):
+        command.add_argument('--id-type', choices=['UniProtID', 'Gene'], default='UniProtID',
+                             help='type of protein ID (default: %(default)s)')
+        command.add_argument('--species', type=int, default=9606, help='ID of organism (default: %(default)s)')
+        command.add_argument('--chunk-size', type=int, default=2000,
+                             help='number of proteins in one mapping request (default: %(default)s)')
+        command.add_argument('--cache', default=None, help='path to SQLite file of STRING cache')
+
+    export = add_command('export', run_export, 'export enrichment tables of analyses saved by "enrich"',
+                         ['xlsx', 'csv', 'parquet', 'feather'], 'xlsx')
+    export.add_argument('--categories', nargs='+', default=None, help='categories of terms (default: all)')
+    export.add_argument('--fdr', type=float, default=1, help='maximal fdr of exported terms (default: %(default)s)')
+    return parser
+
+
+def main(argv=None) -> int:
+    args = make_parser().parse_args(argv)
+
+    from .instrumentation import JSONLinesCollector, add_collector, set_quiet
+    set_quiet(not args.verbose)
+    if args.metrics is not None:
+        add_collector(JSONLinesCollector(args.metrics))
+    try:
+        args.function(args)
+    except Exception as e:
+        print(f'ProteinNetworks {args.command}: {e}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,520 @@
+from   .STRING_enrichment import Check_Value
+
+from   bisect import bisect_left
+import hashlib
+from   multiprocessing import current_process, resource_tracker, shared_memory
+from   multiprocessing.connection import Client, Listener
+import numpy as np
+import threading
+
+
+# numeric columns of enrichment table which are published (if they are present)
+SHARED_COLUMNS = ['number_of_genes', 'number_of_genes_in_background', 'p_value', 'fdr']
+
+# columns which terms can be sorted by in 'get_enrichest_terms_in_category'
+SORT_COLUMNS = ['fdr', 'p_value', 'number_of_genes']
+
+# methods of SharedEnrichment which can be called through EnrichmentService
+QUERY_METHODS = {'manifest', 'get_category_terms', 'get_genes_of_term', 'get_genes_by_localization',
+                 'get_enrichest_terms_in_category', 'get_string_ids'}
+
+# 'resource_tracker.register' is switched off while block is attached (see '_attach_memory')
+_attach_lock = threading.Lock()
+
+
+def _encode_strings(values):
+    """
+    function packs strings into one utf8 byte array
+    :param values: list of strings
+    :return: (offsets, data, encoded) - string i is data[offsets[i]:offsets[i + 1]], encoded is list of bytes
+    """
+    encoded = [str(value).encode('utf8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8), encoded
+
+
+def _hash(value: bytes) -> int:
+    """
+    function returns 64-bit hash of string, which is the same in all processes (unlike built-in hash)
+    """
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'little', signed=True)
+
+
+def _attach_memory(name):
+    """
+    function opens existing shared memory block without registering it in resource tracker of this process
+    (otherwise block would be removed when the first attached process exits)
+    :param name: name of block
+    :return: SharedMemory object
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError: # python < 3.13 registers every opened block
+        with _attach_lock:
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                return shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+
+
+class SharedEnrichment:
+    """
+    Read-only enrichment (or annotation) table published in shared memory. Owner process builds it once by
+    'from_analysis' or 'from_annotation', other processes attach it by 'attach(manifest)' without copying:
+    all arrays are views of one shared memory block. Queries work on arrays only, terms are found by hash index
+    """
+
+    def __init__(self, shm, manifest: dict, owner: bool = False):
+        """
+        SharedEnrichment class constructor. Use 'from_analysis', 'from_annotation' or 'attach' to make it
+        :param shm: SharedMemory object
+        :param manifest: dict with name of block, layout of arrays ({name: (dtype, shape, offset)}) and categories
+        :param owner: True - block is removed by 'close'
+        """
+        self._shm = shm
+        self.manifest = manifest
+        self.owner = owner
+        self.categories = manifest['categories']
+        self.columns = manifest['columns']
+        self.arrays = {}
+        for name, (dtype, shape, offset) in manifest['arrays'].items():
+            array = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            array.flags.writeable = False
+            self.arrays[name] = array
+        # memoryviews of arrays: their items are python objects, so binary search doesn`t make numpy scalars
+        self._views = {name: memoryview(array) for name, array in self.arrays.items()}
+
+    @classmethod
+    def publish(cls, terms, genes, term_genes, proteins=None, genes_mapped=None, key='queryItem'):
+        """
+        function copies tables in new shared memory block
+        :param terms: DataFrame with 'category', 'term', 'description' and optionally 'inputGenes' and SHARED_COLUMNS
+                      columns
+        :param genes: list of genes (rows of term_genes)
+        :param term_genes: sparse matrix genes x terms
+        :param proteins: list of proteins of dataset (genes of 'all' compartment). None - all genes
+        :param genes_mapped: mapping table with %key, 'stringId' and 'preferredName' columns (see 'get_string_ids')
+        :param key: column of genes_mapped with input protein IDs
+        :return: SharedEnrichment (owner of block)
+        """
+        term_genes = term_genes.tocsc()
+        categories = list(dict.fromkeys(terms.category.astype(str)))
+        codes = terms.category.astype(str).map({c: i for i, c in enumerate(categories)}).to_numpy(dtype=np.int32)
+        columns = [c for c in SHARED_COLUMNS if c in terms.columns]
+
+        # universe of genes: genes of terms and then proteins of dataset which aren`t in terms
+        universe = list(dict.fromkeys(map(str, genes)))
+        known = set(universe)
+        proteins = universe if proteins is None else list(dict.fromkeys(map(str, proteins)))
+        universe += [p for p in proteins if p not in known]
+        positions = {gene: i for i, gene in enumerate(universe)}
+
+        arrays = {'category': codes, 'term_genes.indptr': term_genes.indptr.astype(np.int64),
+                  'term_genes.indices': term_genes.indices.astype(np.int32),
+                  'proteins': np.array([positions[p] for p in proteins], dtype=np.int32)}
+        for column in columns:
+            arrays[column] = terms[column].to_numpy(dtype=np.float64)
+
+        # rows sorted by category (and by column), 'bounds' are borders of categories
+        category_order = np.argsort(codes, kind='stable')
+        arrays['order.category'] = category_order
+        arrays['bounds'] = np.searchsorted(codes[category_order], np.arange(len(categories) + 1))
+        for column in SORT_COLUMNS:
+            if column in columns:
+                arrays[f'order.{column}'] = np.lexsort((arrays[column], codes))
+
+        strings = {'term': terms.term, 'description': terms.description, 'gene': universe}
+        input_genes = 'inputGenes' in terms.columns
+        if input_genes: # genes of terms in the same order as in enrichment table (see 'get_genes_of_term')
+            valid = terms.inputGenes.map(lambda genes: isinstance(genes, str)).to_numpy(dtype=bool)
+            strings['inputGenes'] = terms.inputGenes.where(valid, '')
+            arrays['inputGenes.valid'] = valid.astype(np.uint8)
+        if genes_mapped is not None:
+            strings.update({'mapped.key': genes_mapped[key], 'mapped.stringId': genes_mapped.stringId,
+                            'mapped.preferredName': genes_mapped.preferredName})
+        encoded = {}
+        for name, values in strings.items():
+            arrays[f'{name}.offsets'], arrays[f'{name}.data'], encoded[name] = _encode_strings(values)
+
+        # hash indexes of strings: positions sorted by (hash, position), so string is found by binary search of its
+        # hash and the first position is the first row. 'component' - descriptions of 'Component' rows
+        components = category_order[arrays['bounds'][categories.index('Component')]:
+                                    arrays['bounds'][categories.index('Component') + 1]] \
+            if 'Component' in categories else np.empty(0, dtype=np.int64)
+        indexes = {'term': ('term', np.arange(len(codes))), 'component': ('description', np.sort(components))}
+        if genes_mapped is not None:
+            indexes['mapped'] = ('mapped.key', np.arange(len(genes_mapped)))
+        for index, (name, positions) in indexes.items():
+            hashes = np.array([_hash(encoded[name][i]) for i in positions], dtype=np.int64)
+            order = np.lexsort((positions, hashes))
+            arrays[f'hash.{index}'], arrays[f'index.{index}'] = hashes[order], positions[order].astype(np.int64)
+
+        layout, size = {}, 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            layout[name] = (array.dtype.str, list(array.shape), size)
+            size += -(-array.nbytes // 8) * 8 # 8-byte alignment
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, array in arrays.items():
+            dtype, shape, offset = layout[name]
+            np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)[...] = array
+        manifest = {'name': shm.name, 'arrays': layout, 'categories': categories, 'columns': columns,
+                    'mapped': genes_mapped is not None, 'input_genes': input_genes}
+        return cls(shm, manifest, owner=True)
+
+    @classmethod
+    def from_analysis(cls, ea):
+        """
+        function publishes enrichment table, mapped genes and proteins of analysis
+        :param ea: EnrichmentAnalysis object with enrichment table
+        :return: SharedEnrichment (owner of block)
+        """
+        if ea.enrichment is None:
+            raise Exception('Enrichment table is empty. Call "get_enrichment" first')
+        genes, matrix = ea._get_incidence()
+        genes_mapped = getattr(ea, 'genes_mapped', None)
+        return cls.publish(ea.enrichment, genes, matrix, proteins=ea.proteins.dropna().unique(),
+                           genes_mapped=genes_mapped, key=ea.types[ea.protein_id_type])
+
+    @classmethod
+    def from_annotation(cls, annotation):
+        """
+        function publishes annotation table (see 'local_enrichment.AnnotationTable'). 'all' compartment contains
+        all annotated genes
+        :param annotation: AnnotationTable object
+        :return: SharedEnrichment (owner of block)
+        """
+        terms = annotation.terms.assign(number_of_genes=annotation.term_sizes)
+        return cls.publish(terms, annotation.genes, annotation.matrix)
+
+    @classmethod
+    def attach(cls, manifest: dict):
+        """
+        function attaches table published by another process. Arrays aren`t copied
+        :param manifest: manifest of published table (SharedEnrichment.manifest)
+        :return: SharedEnrichment
+        """
+        return cls(_attach_memory(manifest['name']), manifest)
+
+    def close(self) -> None:
+        """
+        function detaches shared memory block. Owner also removes block: processes which are attached keep working,
+        but new processes can`t attach it
+        :return: None
+        """
+        for view in self._views.values():
+            view.release()
+        self.arrays, self._views = {}, {}
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _strings(self, name: str, positions) -> list:
+        """
+        function decodes strings of string array %name
+        :param name: name of string array: 'term', 'description', 'gene' or 'mapped.*'
+        :param positions: positions of strings
+        :return: list of strings
+        """
+        offsets, data = self._views[f'{name}.offsets'], self._views[f'{name}.data']
+        return [str(data[offsets[i]:offsets[i + 1]], 'utf8') for i in positions]
+
+    def _search(self, index: str, name: str, value: str) -> list:
+        """
+        function finds positions of string by hash index
+        :param index: name of hash index: 'term', 'component' or 'mapped'
+        :param name: name of string array of index
+        :param value: string
+        :return: sorted list of positions of strings which are equal to value
+        """
+        value = str(value).encode('utf8')
+        key = _hash(value)
+        hashes, order = self._views[f'hash.{index}'], self._views[f'index.{index}']
+        offsets, data = self._views[f'{name}.offsets'], self._views[f'{name}.data']
+        positions = []
+        i = bisect_left(hashes, key)
+        while i < len(hashes) and hashes[i] == key:
+            k = order[i]
+            if data[offsets[k]:offsets[k + 1]] == value: # the same hash of different strings is possible
+                positions.append(k)
+            i += 1
+        return positions
+
+    def _category_rows(self, category: str, order='category'):
+        """
+        function returns positions of rows of category sorted by %order
+        """
+        Check_Value(category, set(self.categories), 'category')
+        code = self.categories.index(category)
+        bounds = self.arrays['bounds']
+        return self.arrays[f'order.{order}'][bounds[code]:bounds[code + 1]]
+
+    def _term_genes(self, position: int):
+        """
+        function returns positions of genes of term row
+        """
+        indptr = self._views['term_genes.indptr']
+        return self._views['term_genes.indices'][indptr[position]:indptr[position + 1]]
+
+    def get_category_terms(self, category: str, term_type: str = 'id') -> set:
+        """
+        function returns set of all terms in chosen category (see 'EnrichmentAnalysis.get_category_terms')
+        :param category: Name of category
+        :param term_type: 'id' or 'description'
+        :return: set of terms
+        """
+        Check_Value(term_type, {'description', 'id'}, 'term_type')
+        return set(self._strings({'id': 'term', 'description': 'description'}[term_type],
+                                 self._category_rows(category)))
+
+    def get_genes_of_term(self, term: str):
+        """
+        function returns genes of term (see 'EnrichmentAnalysis.get_genes_of_term'). Genes of enrichment table are
+        in the same order as in its 'inputGenes' column, genes of annotation table - in order of annotation genes
+        :param term: term ID
+        :return: list of genes or None if term isn`t found
+        """
+        positions = self._search('term', 'term', term)
+        if not positions:
+            return None
+        if self.manifest.get('input_genes'):
+            if not self._views['inputGenes.valid'][positions[0]]:
+                return None
+            return self._strings('inputGenes', positions[:1])[0].strip().split(',')
+        return self._strings('gene', self._term_genes(positions[0]))
+
+    def get_genes_by_localization(self, compartments: list, set_operation: str) -> list:
+        """
+        function returns proteins localized in compartments (see 'EnrichmentAnalysis.get_genes_by_localization')
+        :param compartments: list of descriptions of 'Component' terms or 'all'
+        :param set_operation: 'union', 'intersection', 'difference' or 'symmetric_difference'
+        :return: list of genes
+        """
+        Check_Value(set_operation, {'union', 'intersection', 'difference', 'symmetric_difference'}, 'set_operation')
+        operations = {'union': np.logical_or, 'intersection': np.logical_and,
+                      'difference': lambda a, b: a & ~b, 'symmetric_difference': np.logical_xor}
+        masks = []
+        for compartment in compartments:
+            mask = np.zeros(len(self.arrays['gene.offsets']) - 1, dtype=bool)
+            if compartment == 'all':
+                mask[self.arrays['proteins']] = True
+            else:
+                positions = self._search('component', 'description', compartment)
+                if not positions:
+                    raise Exception(f'There is no such compartment: "{compartment}". '
+                                    f'If you want to get all genes, use tag "all" in compartments list')
+                mask[self._term_genes(positions[0])] = True
+            masks.append(mask)
+        loc_mask = masks[0]
+        for mask in masks[1:]:
+            loc_mask = operations[set_operation](loc_mask, mask)
+        return self._strings('gene', np.flatnonzero(loc_mask))
+
+    def get_enrichest_terms_in_category(self, category: str, count: int = 10, sort_by='fdr') -> list:
+        """
+        function returns top-%count of most enriched terms in category
+        (see 'EnrichmentAnalysis.show_enrichest_terms_in_category')
+        :param category: Name of category
+        :param count: count of terms
+        :param sort_by: 'fdr', 'p_value' or 'number_of_genes' (ascending)
+        :return: list of dicts with 'term', 'description' and numeric columns of table
+        """
+        Check_Value(sort_by, {c for c in SORT_COLUMNS if c in self.columns}, 'sort_by')
+        rows = self._category_rows(category, order=sort_by)[:count]
+        terms = [{'term': term, 'description': description} for term, description in
+                 zip(self._strings('term', rows), self._strings('description', rows))]
+        for column in self.columns:
+            for record, value in zip(terms, self.arrays[column][rows].tolist()):
+                record[column] = value
+        return terms
+
+    def get_string_ids(self, proteins) -> dict:
+        """
+        function returns STRING ids of proteins from published mapping table (see 'EnrichmentAnalysis.get_mapped')
+        :param proteins: list of protein IDs
+        :return: dict {protein: list of STRING ids}, proteins which aren`t mapped are skipped
+        """
+        if not self.manifest['mapped']:
+            raise Exception('Mapping table wasn`t published')
+        mapped = {}
+        for protein in proteins:
+            positions = self._search('mapped', 'mapped.key', protein)
+            if positions:
+                mapped[protein] = self._strings('mapped.stringId', positions)
+        return mapped
+
+
+class EnrichmentService:
+    """
+    Long-running local service. Tables are published in shared memory once, then many worker processes use one
+    warm copy: they attach tables without copying (see 'EnrichmentClient.attach') or send batches of queries through
+    local socket (see 'EnrichmentClient.batch').
+    Service can be used as context manager: with EnrichmentService(...) as service: ...
+    """
+
+    def __init__(self, tables: dict, address=None, authkey: bytes = None):
+        """
+        EnrichmentService class constructor. Tables are published immediately, queries are served after 'start'
+        (in background thread) or 'serve_forever'
+        :param tables: dict {name: EnrichmentAnalysis, AnnotationTable or SharedEnrichment}
+        :param address: address of socket: path of unix socket or (host, port). By default, new unix socket
+        :param authkey: key of authentication of clients (bytes). By default, authkey of current process (random key
+                        which is inherited by processes started by multiprocessing, as in multiprocessing managers).
+                        Clients are always authenticated, because queries are unpickled
+        """
+        self.tables = {}
+        for name, table in tables.items():
+            if isinstance(table, SharedEnrichment):
+                self.tables[name] = table
+            elif hasattr(table, 'term_sizes'):
+                self.tables[name] = SharedEnrichment.from_annotation(table)
+            else:
+                self.tables[name] = SharedEnrichment.from_analysis(table)
+        self.authkey = bytes(current_process().authkey) if authkey is None else authkey
+        self._listener = Listener(address, authkey=self.authkey)
+        self.address = self._listener.address
+        self._thread = None
+        self._closed = False
+
+    def _answer(self, requests: list) -> list:
+        """
+        function answers batch of queries
+        :param requests: list of (table, method, args, kwargs). Table None and method 'tables' - list of tables
+        :return: list of (True, result) or (False, error message)
+        """
+        answers = []
+        for table, method, args, kwargs in requests:
+            try:
+                if method == 'tables':
+                    answers.append((True, list(self.tables)))
+                    continue
+                Check_Value(method, QUERY_METHODS | {'tables'}, 'method')
+                Check_Value(table, set(self.tables), 'table')
+                value = getattr(self.tables[table], method)
+                answers.append((True, value(*args, **kwargs) if callable(value) else value))
+            except Exception as e:
+                answers.append((False, str(e)))
+        return answers
+
+    def _serve_connection(self, connection) -> None:
+        """
+        function answers batches of one client until it disconnects
+        """
+        with connection:
+            while True:
+                try:
+                    requests = connection.recv()
+                except (EOFError, OSError):
+                    break
+                connection.send(self._answer(requests))
+
+    def serve_forever(self) -> None:
+        """
+        function accepts clients until service is closed. Every client is served by its own thread
+        :return: None
+        """
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                break
+            except Exception: # failed authentication
+                continue
+            threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+    def start(self):
+        """
+        function starts serving in background thread
+        :return: self
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        """
+        function stops service and removes published tables
+        :return: None
+        """
+        self._closed = True
+        self._listener.close()
+        for table in self.tables.values():
+            table.close()
+
+    def __enter__(self):
+        return self.start() if self._thread is None else self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class EnrichmentClient:
+    """
+    Client of EnrichmentService. Queries of one batch are sent by one message. Client can be used as context manager
+    """
+
+    def __init__(self, address, authkey: bytes = None):
+        """
+        EnrichmentClient class constructor.
+        :param address: address of service (EnrichmentService.address)
+        :param authkey: key of authentication (EnrichmentService.authkey). By default, authkey of current process
+                        (works in processes started by multiprocessing from process of service)
+        """
+        self._connection = Client(address, authkey=bytes(current_process().authkey) if authkey is None else authkey)
+        self._lock = threading.Lock()
+
+    def batch(self, requests: list) -> list:
+        """
+        function sends batch of queries by one message
+        :param requests: list of (table, method, args, kwargs) or (table, method, kwargs). Methods are methods of
+                         SharedEnrichment: 'get_category_terms', 'get_genes_of_term', 'get_genes_by_localization',
+                         'get_enrichest_terms_in_category', 'get_string_ids'
+        :return: list of results
+        """
+        requests = [(r[0], r[1], (), r[2]) if len(r) == 3 else tuple(r) for r in requests]
+        with self._lock:
+            self._connection.send(requests)
+            answers = self._connection.recv()
+        for (table, method, _, _), (ok, result) in zip(requests, answers):
+            if not ok:
+                raise Exception(f'{table}.{method}: {result}')
+        return [result for _, result in answers]
+
+    def query(self, table: str, method: str, *args, **kwargs):
+        """
+        function sends one query. For example: client.query('cohort', 'get_genes_of_term', 'GO:0005634')
+        :return: result of query
+        """
+        return self.batch([(table, method, args, kwargs)])[0]
+
+    def tables(self) -> list:
+        """
+        function returns names of tables of service
+        """
+        return self.query(None, 'tables')
+
+    def attach(self, table: str) -> SharedEnrichment:
+        """
+        function attaches shared table of service, so queries work in this process without socket and copying
+        :param table: name of table
+        :return: SharedEnrichment (close it before service is closed)
+        """
+        return SharedEnrichment.attach(self.query(table, 'manifest'))
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,179 @@
+from   .STRING_enrichment import Check_Value
+from   .local_enrichment import benjamini_hochberg
+
+import numpy as np
+import pandas as pd
+from   scipy.stats import ttest_ind
+
+
+# columns of enrichment table which are stored as term x group arrays
+COMPARISON_VALUES = {'fdr': np.float32, 'enrich_score': np.float32, 'number_of_genes': np.int32}
+
+
+class EnrichmentComparison:
+    """
+    Enrichment results of many groups (conditions) aligned into term x group arrays of fdr, enrich_score and
+    number_of_genes. Terms are sorted by category, so terms of each category are contiguous slice of arrays
+    (see 'category'). Absent term of group has fdr=1, enrich_score=0 and number_of_genes=0
+    """
+
+    def __init__(self, groups, terms, fdr, enrich_score, number_of_genes):
+        """
+        EnrichmentComparison class constructor. Use 'from_analyses' or 'from_table' to build it from enrichment results
+        :param groups: list of group names (columns of arrays)
+        :param terms: DataFrame with columns 'category', 'term', 'description' sorted by category (rows of arrays)
+        :param fdr: array terms x groups
+        :param enrich_score: array terms x groups
+        :param number_of_genes: array terms x groups
+        """
+        self.groups = pd.Index(groups)
+        self.terms = terms.reset_index(drop=True)
+        self.fdr = fdr
+        self.enrich_score = enrich_score
+        self.number_of_genes = number_of_genes
+
+        categories = self.terms.category.to_numpy()
+        starts = np.flatnonzero(np.r_[True, categories[1:] != categories[:-1]]) if len(categories) else []
+        ends = np.r_[starts[1:], len(categories)] if len(categories) else []
+        self._category_slices = {categories[s]: slice(s, e) for s, e in zip(starts, ends)}
+
+    @classmethod
+    def from_table(cls, results, group_column='cohort'):
+        """
+        function builds comparison from long-form enrichment table of all groups (for example, results of
+        'batch_enrichment.enrich_cohorts')
+        :param results: DataFrame with enrichment columns and column of group names
+        :param group_column: name of column of group names
+        :return: EnrichmentComparison
+        """
+        if 'enrich_score' not in results.columns:
+            results = results.assign(enrich_score=np.round(-np.log2(results.fdr.to_numpy(dtype=float)), 1))
+        group_codes, groups = pd.factorize(results[group_column], sort=False)
+        category_codes, categories = pd.factorize(results.category.astype(str), sort=True)
+        name_codes, names = pd.factorize(results.term.astype(str), sort=False)
+        term_codes, keys = pd.factorize(category_codes.astype(np.int64) * len(names) + name_codes, sort=True)
+
+        # terms are sorted by category (codes of keys are sorted), then by term
+        first = np.full(len(keys), len(results), dtype=np.intp)
+        np.minimum.at(first, term_codes, np.arange(len(results)))
+        terms = pd.DataFrame({'category': categories[keys // len(names)], 'term': names[keys % len(names)],
+                              'description': results.description.to_numpy()[first]})
+
+        arrays = {}
+        for column, dtype in COMPARISON_VALUES.items():
+            empty = 1 if column == 'fdr' else 0
+            arrays[column] = np.full((len(terms), len(groups)), empty, dtype=dtype)
+            arrays[column][term_codes, group_codes] = results[column].to_numpy(dtype=dtype)
+        return cls(groups, terms, **arrays)
+
+    @classmethod
+    def from_analyses(cls, analyses: dict):
+        """
+        function builds comparison from enrichment results of many groups
+        :param analyses: dict {group name: EnrichmentAnalysis or enrichment DataFrame}
+        :return: EnrichmentComparison
+        """
+        tables = [getattr(enrichment, 'enrichment', enrichment).assign(group=name)
+                  for name, enrichment in analyses.items()]
+        return cls.from_table(pd.concat(tables, ignore_index=True), group_column='group')
+
+    def _group_positions(self, groups):
+        """
+        function returns positions of groups in arrays
+        :param groups: list of group names
+        :return: numpy array of positions
+        """
+        positions = self.groups.get_indexer(list(groups))
+        if (positions < 0).any():
+            missing = [g for g, p in zip(groups, positions) if p < 0]
+            raise Exception(f'Groups {missing} not found. Choose from {list(self.groups)}')
+        return positions
+
+    def category(self, category: str):
+        """
+        function returns comparison of terms of one category. Arrays aren`t copied (slices of arrays are used)
+        :param category: Name of category
+        :return: EnrichmentComparison
+        """
+        Check_Value(category, set(self._category_slices), 'category')
+        rows = self._category_slices[category]
+        return EnrichmentComparison(self.groups, self.terms.iloc[rows], self.fdr[rows], self.enrich_score[rows],
+                                    self.number_of_genes[rows])
+
+    def select(self, groups: list):
+        """
+        function returns comparison of chosen groups
+        :param groups: list of group names
+        :return: EnrichmentComparison
+        """
+        positions = self._group_positions(groups)
+        return EnrichmentComparison(self.groups[positions], self.terms, self.fdr[:, positions],
+                                    self.enrich_score[:, positions], self.number_of_genes[:, positions])
+
+    def to_frame(self, value='enrich_score') -> pd.DataFrame:
+        """
+        function returns wide table term x group of chosen value
+        :param value: 'fdr', 'enrich_score' or 'number_of_genes'
+        :return: DataFrame with 'category', 'term', 'description' columns and one column per group
+        """
+        Check_Value(value, set(COMPARISON_VALUES), 'value')
+        return pd.concat([self.terms, pd.DataFrame(getattr(self, value), columns=self.groups)], axis=1)
+
+    def term_statistics(self, fdr_threshold: float = 0.05) -> pd.DataFrame:
+        """
+        function computes statistics of each term across groups
+        :param fdr_threshold: term is enriched in group if fdr < fdr_threshold
+        :return: DataFrame with columns 'category', 'term', 'description', 'enriched_groups' (number of groups),
+                 'mean_score', 'std_score', 'max_score', 'top_group' (group with max enrich_score), 'specificity'
+                 (share of sum of enrich_score in top group)
+        """
+        scores = self.enrich_score
+        total = scores.sum(axis=1)
+        max_score = scores.max(axis=1)
+        statistics = self.terms.assign(enriched_groups=(self.fdr < fdr_threshold).sum(axis=1),
+                                       mean_score=scores.mean(axis=1), std_score=scores.std(axis=1),
+                                       max_score=max_score, top_group=self.groups.to_numpy()[scores.argmax(axis=1)])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            statistics['specificity'] = np.where(total > 0, max_score / total, 0)
+        return statistics
+
+    def differential(self, groups_a: list, groups_b: list) -> pd.DataFrame:
+        """
+        function compares enrich_score of terms between two sets of groups by Welch t-test. FDR is computed
+        within each category
+        :param groups_a: list of group names of the first set
+        :param groups_b: list of group names of the second set
+        :return: DataFrame with columns 'category', 'term', 'description', 'mean_a', 'mean_b', 'difference',
+                 'statistic', 'p_value', 'fdr' sorted by p_value
+        """
+        a = self.enrich_score[:, self._group_positions(groups_a)].astype(float)
+        b = self.enrich_score[:, self._group_positions(groups_b)].astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            statistic, p_values = ttest_ind(a, b, axis=1, equal_var=False)
+        p_values = np.nan_to_num(p_values, nan=1.0)
+        table = self.terms.assign(mean_a=a.mean(axis=1), mean_b=b.mean(axis=1))
+        table['difference'] = table.mean_a - table.mean_b
+        table['statistic'] = statistic
+        table['p_value'] = p_values
+        table['fdr'] = benjamini_hochberg(p_values, table.category.to_numpy())
+        return table.sort_values('p_value', kind='stable')
+
+    def group_similarity(self, metric='jaccard', fdr_threshold: float = 0.05) -> pd.DataFrame:
+        """
+        function computes similarity of all pairs of groups
+        :param metric: 'jaccard' - Jaccard index of sets of enriched terms (fdr < fdr_threshold),
+                       'pearson' - correlation of enrich_score
+        :param fdr_threshold: work with metric='jaccard', threshold of enriched terms
+        :return: DataFrame groups x groups
+        """
+        Check_Value(metric, {'jaccard', 'pearson'}, 'metric')
+        if metric == 'jaccard':
+            enriched = (self.fdr < fdr_threshold).astype(np.float32)
+            intersection = enriched.T @ enriched
+            sizes = np.diag(intersection)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                similarity = intersection / (sizes[:, None] + sizes[None, :] - intersection)
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                similarity = np.corrcoef(self.enrich_score, rowvar=False)
+        return pd.DataFrame(similarity, index=self.groups, columns=self.groups)
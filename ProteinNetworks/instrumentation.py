@@ -0,0 +1,226 @@
+from   contextlib import contextmanager
+import contextvars
+import functools
+import json
+import threading
+import time
+
+
+# collectors of events (see 'add_collector'). Without collectors events aren`t made at all
+_collectors = []
+
+# quiet mode: banners, messages and tables aren`t rendered (see 'set_quiet')
+_quiet = False
+
+# event of innermost measured call in current thread or task (see 'add_fields')
+_current_event = contextvars.ContextVar('current_event', default=None)
+
+
+def set_quiet(quiet: bool = True) -> None:
+    """
+    function turns on/off global quiet mode. In quiet mode banners, messages and tables aren`t rendered
+    :param quiet: True - quiet mode, False - printing mode
+    :return: None
+    """
+    global _quiet
+    _quiet = quiet
+
+
+def is_quiet() -> bool:
+    """
+    function returns True in quiet mode
+    """
+    return _quiet
+
+
+@contextmanager
+def quiet():
+    """
+    context manager which turns on quiet mode inside block: with quiet(): ...
+    """
+    previous = _quiet
+    set_quiet(True)
+    try:
+        yield
+    finally:
+        set_quiet(previous)
+
+
+def echo(*args, **kwargs) -> None:
+    """
+    function prints message like print(), but nothing is done in quiet mode
+    :return: None
+    """
+    if not _quiet:
+        print(*args, **kwargs)
+
+
+class MetricsRegistry:
+    """
+    In-memory collector of events. Events are dicts with keys 'name', 'kind' ('method', 'network', 'subprocess'),
+    'seconds' and optional 'rows_in', 'rows_out', 'cache_hit', 'error' and others
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def record(self, event: dict) -> None:
+        """
+        function stores event
+        :param event: dict of event
+        :return: None
+        """
+        with self._lock:
+            self.events.append(event)
+
+    def clear(self) -> None:
+        """
+        function removes all stored events
+        :return: None
+        """
+        with self._lock:
+            self.events = []
+
+    def summary(self):
+        """
+        function aggregates events by name
+        :return: DataFrame with columns 'name', 'kind', 'calls', 'total_seconds', 'mean_seconds', 'max_seconds',
+                 'cache_hits' sorted by total_seconds
+        """
+        import pandas as pd
+        columns = ['name', 'kind', 'calls', 'total_seconds', 'mean_seconds', 'max_seconds', 'cache_hits']
+        if not self.events:
+            return pd.DataFrame(columns=columns)
+        df = pd.DataFrame(self.events)
+        if 'cache_hit' not in df.columns:
+            df['cache_hit'] = False
+        df['cache_hit'] = df.cache_hit.fillna(False).astype(bool)
+        summary = df.groupby(['name', 'kind'], sort=False).agg(calls=('seconds', 'size'),
+                                                                total_seconds=('seconds', 'sum'),
+                                                                mean_seconds=('seconds', 'mean'),
+                                                                max_seconds=('seconds', 'max'),
+                                                                cache_hits=('cache_hit', 'sum')).reset_index()
+        return summary.sort_values('total_seconds', ascending=False).reset_index(drop=True)
+
+
+class JSONLinesCollector:
+    """
+    Collector which appends every event to JSON-lines file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, event: dict) -> None:
+        line = json.dumps(event, default=str)
+        with self._lock, open(self.path, 'a', encoding='utf8') as f:
+            f.write(line + '\n')
+
+
+class CallbackCollector:
+    """
+    Collector which calls function with every event
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def record(self, event: dict) -> None:
+        self.callback(event)
+
+
+def add_collector(collector):
+    """
+    function adds collector of events
+    :param collector: MetricsRegistry, JSONLinesCollector, any object with 'record(event)' method or function
+    :return: collector
+    """
+    if not hasattr(collector, 'record'):
+        collector = CallbackCollector(collector)
+    _collectors.append(collector)
+    return collector
+
+
+def remove_collector(collector) -> None:
+    """
+    function removes collector added by 'add_collector'
+    :param collector: collector returned by 'add_collector'
+    :return: None
+    """
+    if collector in _collectors:
+        _collectors.remove(collector)
+
+
+def add_fields(**fields) -> None:
+    """
+    function adds fields to event of innermost measured call (for example, rows_out or cache_hit)
+    :param fields: fields of event
+    :return: None
+    """
+    event = _current_event.get()
+    if event is not None:
+        event.update(fields)
+
+
+def count_rows(obj):
+    """
+    function returns number of rows of object: proteins of analysis, rows of table or elements of list
+    :param obj: object
+    :return: number of rows or None
+    """
+    if hasattr(obj, 'proteins'):
+        return len(obj.proteins)
+    if hasattr(obj, 'shape') and len(obj.shape):
+        return obj.shape[0]
+    if isinstance(obj, (list, tuple, set, dict)):
+        return len(obj)
+    return None
+
+
+@contextmanager
+def measure(name: str, kind: str = 'method', **fields):
+    """
+    context manager which measures wall time of block and sends event to collectors
+    :param name: name of event. For example, 'EnrichmentAnalysis.get_mapped'
+    :param kind: kind of event: 'method', 'network' or 'subprocess'
+    :param fields: other fields of event
+    :return: event dict (fields can be added inside block)
+    """
+    if not _collectors:
+        yield {}
+        return
+    event = {'name': name, 'kind': kind, 'time': time.time()}
+    event.update(fields)
+    token = _current_event.set(event)
+    start = time.perf_counter()
+    try:
+        yield event
+    except BaseException as e:
+        event['error'] = repr(e)
+        raise
+    finally:
+        event['seconds'] = time.perf_counter() - start
+        _current_event.reset(token)
+        for collector in list(_collectors):
+            collector.record(event)
+
+
+def instrumented(func):
+    """
+    Decorator measures calls of function: wall time, rows in (first argument, see 'count_rows') and rows out
+    (result). Events are sent to collectors
+    :param func: function or method
+    :return: wrapped function
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _collectors:
+            return func(*args, **kwargs)
+        with measure(func.__qualname__, rows_in=count_rows(args[0]) if args else None) as event:
+            result = func(*args, **kwargs)
+            if 'rows_out' not in event:
+                event['rows_out'] = count_rows(result)
+            return result
+    return wrapper
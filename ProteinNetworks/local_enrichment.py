@@ -0,0 +1,336 @@
+from   concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import os
+import pandas as pd
+from   scipy import sparse
+from   scipy.stats import hypergeom
+
+
+# columns of enrichment table in the same order as in STRING enrichment results
+ENRICHMENT_COLUMNS = ['category', 'term', 'number_of_genes', 'number_of_genes_in_background', 'ncbiTaxonId',
+                      'inputGenes', 'preferredNames', 'p_value', 'fdr', 'description']
+
+# names of categories in STRING '*.protein.enrichment.terms' files and their short names in STRING API results
+STRING_CATEGORIES = {'Biological Process (Gene Ontology)': 'Process',
+                     'Molecular Function (Gene Ontology)': 'Function',
+                     'Cellular Component (Gene Ontology)': 'Component',
+                     'Annotated Keywords (UniProt)': 'Keyword',
+                     'KEGG Pathways': 'KEGG',
+                     'Reactome Pathways': 'RCTM',
+                     'WikiPathways': 'WikiPathways',
+                     'Protein Domains (Pfam)': 'Pfam',
+                     'Protein Domains and Features (InterPro)': 'InterPro',
+                     'Protein Domains (SMART)': 'SMART',
+                     'Reference publications (PubMed)': 'PMID',
+                     'Local network cluster (STRING)': 'NetworkNeighborAL',
+                     'Subcellular localization (COMPARTMENTS)': 'COMPARTMENTS',
+                     'Tissue expression (TISSUES)': 'TISSUES',
+                     'Disease-gene associations (DISEASES)': 'DISEASES',
+                     'Human Phenotype (Monarch)': 'HPO'}
+
+# aspects of GO terms in GAF files
+GAF_ASPECTS = {'P': 'Process', 'F': 'Function', 'C': 'Component'}
+
+
+def benjamini_hochberg(p_values, groups=None):
+    """
+    function computes Benjamini-Hochberg FDR. If groups are given, FDR is computed within each group separately
+    (STRING computes FDR within each category)
+    :param p_values: array of p-values
+    :param groups: array of group labels of p-values. None - all p-values in one group
+    :return: numpy array of FDR values
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    if len(p_values) == 0:
+        return p_values.copy()
+    codes = np.zeros(len(p_values), dtype=int) if groups is None else pd.factorize(np.asarray(groups))[0]
+    order = np.lexsort((p_values, codes))
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    sizes = np.diff(np.r_[starts, len(order)])
+    group_size = np.repeat(sizes, sizes)
+    rank = np.arange(len(order)) - np.repeat(starts, sizes) + 1
+    adjusted = p_values[order] * group_size / rank
+
+    # cumulative minimum from the end of each group
+    reversed_groups = sorted_codes[::-1]
+    adjusted = pd.Series(adjusted[::-1]).groupby(reversed_groups).cummin().to_numpy()[::-1]
+
+    fdr = np.empty(len(p_values))
+    fdr[order] = np.minimum(adjusted, 1)
+    return fdr
+
+
+# background x term incidence matrix of permutation worker process. It`s loaded once per worker by
+# '_init_permutation_worker'
+_WORKER_MATRIX = None
+
+
+def _init_permutation_worker(matrix):
+    """
+    function stores background incidence matrix in worker process, so it isn`t sent with every batch
+    :param matrix: sparse CSR matrix background genes x terms
+    :return: None
+    """
+    global _WORKER_MATRIX
+    _WORKER_MATRIX = matrix
+
+
+def _count_exceedances(task):
+    """
+    function draws batch of random gene sets from background and counts for each term number of random sets
+    with overlap >= observed overlap. Overlaps of all sets with all terms are computed by one sparse product
+    :param task: tuple (seed, number of random sets, size of gene set, observed overlaps of terms)
+    :return: numpy array of counts for each term
+    """
+    seed, n_permutations, set_size, observed = task
+    rng = np.random.default_rng(seed)
+    n_genes = _WORKER_MATRIX.shape[0]
+    genes = rng.random((n_permutations, n_genes)).argpartition(set_size - 1, axis=1)[:, :set_size]
+    random_sets = sparse.csr_matrix((np.ones(genes.size, dtype=np.float32), genes.ravel(),
+                                     np.arange(0, genes.size + 1, set_size)), shape=(n_permutations, n_genes))
+    overlaps = (random_sets @ _WORKER_MATRIX).tocsr()
+    hits = overlaps.data >= observed[overlaps.indices]
+    counts = np.bincount(overlaps.indices[hits], minlength=len(observed))
+    counts[observed <= 0] = n_permutations # zero overlap is reached by any set
+    return counts
+
+
+class AnnotationTable:
+    """
+    Local table of term -> gene annotations. It`s loaded once and then scores any number of gene lists
+    without network requests (see 'enrich')
+    """
+
+    def __init__(self, annotation, id_column='stringId', species=9606):
+        """
+        AnnotationTable class constructor.
+        :param annotation: DataFrame with columns 'gene', 'category', 'term', 'description' (one row per gene-term pair)
+        :param id_column: column of EnrichmentAnalysis.genes_mapped which contains genes of annotation:
+                          'stringId', 'queryItem' or 'preferredName'
+        :param species: ID of organism
+        """
+        annotation = annotation[['gene', 'category', 'term', 'description']].dropna(subset=['gene', 'term'])
+        self.id_column = id_column
+        self.species = species
+
+        gene_codes, genes = pd.factorize(annotation.gene.astype(str))
+        self.genes = pd.Index(genes)
+        term_codes, _ = pd.factorize(annotation.category.astype(str) + '\t' + annotation.term.astype(str))
+        first = pd.Series(np.arange(len(term_codes))).groupby(term_codes).first().to_numpy() # first row of each term
+        self.terms = pd.DataFrame({'category': annotation.category.to_numpy()[first],
+                                   'term': annotation.term.to_numpy()[first],
+                                   'description': annotation.description.to_numpy()[first]})
+
+        # gene x term incidence matrix
+        matrix = sparse.csr_matrix((np.ones(len(gene_codes), dtype=np.int8), (gene_codes, term_codes)),
+                                   shape=(len(self.genes), len(self.terms)))
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        self.matrix = matrix
+        self.term_matrix = matrix.tocsc() # the same matrix by columns (genes of each term)
+        self.term_sizes = np.diff(self.term_matrix.indptr) # number of genes of each term
+
+    @classmethod
+    def from_string_terms(cls, path, species=9606):
+        """
+        function loads annotation from STRING '<species>.protein.enrichment.terms.<version>.txt(.gz)' file
+        (see https://string-db.org/cgi/download)
+        :param path: path to file
+        :param species: ID of organism
+        :return: AnnotationTable
+        """
+        df = pd.read_csv(path, sep='\t', header=0, names=['gene', 'category', 'term', 'description'],
+                         dtype=str, comment=None)
+        df['category'] = df.category.map(STRING_CATEGORIES).fillna(df.category)
+        return cls(df, id_column='stringId', species=species)
+
+    @classmethod
+    def from_gaf(cls, path, gene_id='UniProtID', descriptions: dict = None, species=9606):
+        """
+        function loads GO annotation from GAF file (http://geneontology.org/docs/go-annotation-file-gaf-format-2.2/).
+        GO aspects are named as STRING categories: 'Process', 'Function', 'Component'.
+        Annotations with 'NOT' qualifier are skipped
+        :param path: path to file
+        :param gene_id: 'UniProtID' - genes are DB Object IDs, 'Gene' - genes are DB Object Symbols
+        :param descriptions: dict of GO terms names {GO-term: name}. By default, description is GO-term
+        :param species: ID of organism
+        :return: AnnotationTable
+        """
+        columns = {'UniProtID': 1, 'Gene': 2}
+        if gene_id not in columns:
+            raise Exception(f'Wrong value of "gene_id" variable! Choose one of {set(columns)}')
+        df = pd.read_csv(path, sep='\t', comment='!', header=None, dtype=str, usecols=[columns[gene_id], 3, 4, 8])
+        df.columns = ['gene', 'qualifier', 'term', 'aspect']
+        df = df[~df.qualifier.fillna('').str.contains('NOT')]
+        df['category'] = df.aspect.map(GAF_ASPECTS)
+        df['description'] = df.term.map(descriptions) if descriptions else df.term
+        df['description'] = df.description.fillna(df.term)
+        id_column = {'UniProtID': 'queryItem', 'Gene': 'preferredName'}[gene_id]
+        return cls(df.drop_duplicates(['gene', 'term']), id_column=id_column, species=species)
+
+    def overlap_counts(self, genes, base=None):
+        """
+        function counts overlaps of gene set with all terms. If state of another gene set is given, counts are
+        updated by added and removed genes only
+        :param genes: list of genes (identifiers of annotation, see id_column)
+        :param base: (rows, counts) - state of another gene set returned by 'overlap_counts'
+        :return: (rows, counts) - sorted positions of genes in annotation and numpy array of overlaps with terms
+        """
+        rows = self.genes.get_indexer(pd.Index(pd.Series(genes, dtype=object).astype(str)).unique())
+        rows = np.unique(rows[rows >= 0])
+        if base is None:
+            counts = np.asarray(self.matrix[rows].sum(axis=0)).ravel()
+        else:
+            base_rows, counts = base
+            added = np.setdiff1d(rows, base_rows, assume_unique=True)
+            removed = np.setdiff1d(base_rows, rows, assume_unique=True)
+            counts = counts + np.asarray(self.matrix[added].sum(axis=0)).ravel() \
+                - np.asarray(self.matrix[removed].sum(axis=0)).ravel()
+        return rows, counts.astype(self.term_sizes.dtype)
+
+    def enrich(self, genes, input_names=None, preferred_names=None, background=None, fdr_threshold: float = 0.05,
+               categories=None, counts=None):
+        """
+        function performs enrichment analysis of gene list. P-values of all terms are computed at once by
+        hypergeometric test, FDR is computed by Benjamini-Hochberg procedure within each category
+        :param genes: list of genes (identifiers of annotation, see id_column)
+        :param input_names: list of names of genes for 'inputGenes' column. By default, genes
+        :param preferred_names: list of names of genes for 'preferredNames' column. By default, input_names
+        :param background: list of background genes. By default, all genes of annotation and input genes
+        :param fdr_threshold: only terms with fdr <= fdr_threshold are returned. None - return all terms with genes
+        :param categories: list of categories to analyse. None - all categories
+        :param counts: overlaps of unique input genes (after background filtering) with terms computed by
+                       'overlap_counts'. By default, they are counted from incidence matrix
+        :return: DataFrame with the same columns as STRING enrichment results
+        """
+        genes = pd.Index(pd.Series(genes, dtype=object).astype(str))
+        input_names = genes.to_numpy() if input_names is None else np.asarray(input_names, dtype=object)
+        preferred_names = input_names if preferred_names is None else np.asarray(preferred_names, dtype=object)
+
+        if background is None:
+            universe_size = len(self.genes.union(genes.unique()))
+            background_counts = self.term_sizes
+        else:
+            background = pd.Index(pd.Series(background, dtype=object).astype(str)).unique()
+            in_background = genes.isin(background)
+            genes, input_names, preferred_names = (genes[in_background], input_names[in_background],
+                                                   preferred_names[in_background])
+            rows = self.genes.get_indexer(background)
+            universe_size = len(background)
+            background_counts = np.asarray(self.matrix[rows[rows >= 0]].sum(axis=0)).ravel()
+
+        # unique input genes which are present in annotation
+        rows = self.genes.get_indexer(genes)
+        found = (rows >= 0) & ~genes.duplicated()
+        input_size = (~genes.duplicated()).sum()
+        input_matrix = None
+        if counts is None:
+            input_matrix = self.matrix[rows[found]]
+            counts = np.diff(input_matrix.tocsc().indptr)
+
+        # hypergeometric test for all terms at once
+        selected = counts > 0
+        if categories is not None:
+            selected &= self.terms.category.isin(categories).to_numpy()
+        positions = np.flatnonzero(selected)
+        # p-value depends only on pair (overlap, term size), so each unique pair is computed once. Pair is packed in
+        # one integer key (np.unique of 1d integers is much faster than np.unique(axis=1))
+        overlaps = counts[positions].astype(np.int64)
+        sizes = background_counts[positions].astype(np.int64)
+        keys, inverse = np.unique(overlaps * (int(sizes.max(initial=0)) + 1) + sizes, return_inverse=True)
+        pair_overlaps, pair_sizes = np.divmod(keys, int(sizes.max(initial=0)) + 1)
+        p_values = hypergeom.sf(pair_overlaps - 1, universe_size, pair_sizes, input_size)[inverse.ravel()]
+        p_values = np.clip(p_values, np.finfo(float).tiny, 1)
+        fdr = benjamini_hochberg(p_values, self.terms.category.to_numpy()[positions])
+
+        keep = np.ones(len(positions), dtype=bool) if fdr_threshold is None else fdr <= fdr_threshold
+        positions, p_values, fdr = positions[keep], p_values[keep], fdr[keep]
+
+        # names of input genes in each term (in order of input genes)
+        input_names, preferred_names = input_names[found], preferred_names[found]
+        if input_matrix is None:
+            # counts were given: only genes of kept terms are looked up among input genes
+            lookup = np.full(len(self.genes), -1)
+            lookup[rows[found]] = np.arange(found.sum())
+            term_matrix = self.term_matrix[:, positions]
+            members = lookup[term_matrix.indices]
+            terms = np.repeat(np.arange(len(positions)), np.diff(term_matrix.indptr))
+            keep_member = members >= 0
+            members, terms = members[keep_member], terms[keep_member]
+            order = np.lexsort((members, terms))
+            members = np.split(members[order], np.searchsorted(terms[order], np.arange(1, len(positions)))) \
+                if len(positions) else []
+        else:
+            input_matrix = input_matrix[:, positions].tocsc()
+            indptr, indices = input_matrix.indptr, input_matrix.indices
+            members = [indices[indptr[i]:indptr[i + 1]] for i in range(len(positions))]
+
+        enrichment = pd.DataFrame({'category': self.terms.category.to_numpy()[positions],
+                                   'term': self.terms.term.to_numpy()[positions],
+                                   'number_of_genes': counts[positions],
+                                   'number_of_genes_in_background': background_counts[positions],
+                                   'ncbiTaxonId': self.species,
+                                   'inputGenes': [','.join(input_names[m]) for m in members],
+                                   'preferredNames': [','.join(preferred_names[m]) for m in members],
+                                   'p_value': p_values,
+                                   'fdr': fdr,
+                                   'description': self.terms.description.to_numpy()[positions]},
+                                  columns=ENRICHMENT_COLUMNS)
+        return enrichment.sort_values(['category', 'p_value'], kind='stable').reset_index(drop=True)
+
+    def permutation_test(self, genes, terms, background=None, permutations: int = 1000, workers: int = None,
+                         seed: int = 0, batch_size: int = 100):
+        """
+        function computes empirical p-values of terms: random gene sets of the same size are drawn from background
+        and overlaps of all terms with all random sets are computed by sparse products. For fixed sizes of sets and
+        terms overlap is monotone with hypergeometric p-value, so p = (1 + number of random sets with overlap >=
+        observed) / (1 + permutations). Batches of random sets are scored in process pool, each batch has its own
+        seed spawned from %seed, so results don`t depend on number of workers
+        :param genes: list of genes (identifiers of annotation, see id_column)
+        :param terms: DataFrame with 'category' and 'term' columns (for example, enrichment table)
+        :param background: list of background genes. By default, all genes of annotation and input genes
+        :param permutations: number of random gene sets
+        :param workers: number of worker processes. By default, number of CPUs. 1 - without process pool
+        :param seed: seed of random generator
+        :param batch_size: number of random gene sets scored at once
+        :return: numpy array of empirical p-values of terms (NaN for terms absent in annotation)
+        """
+        genes = pd.Index(pd.Series(genes, dtype=object).astype(str)).unique()
+        if background is None:
+            universe = self.genes.union(genes)
+        else:
+            universe = pd.Index(pd.Series(background, dtype=object).astype(str)).unique()
+        genes = genes[genes.isin(universe)]
+
+        keys = pd.MultiIndex.from_arrays([self.terms.category.astype(str), self.terms.term.astype(str)])
+        positions = keys.get_indexer(pd.MultiIndex.from_arrays([terms.category.astype(str), terms.term.astype(str)]))
+        found = positions >= 0
+
+        # background x term matrix with extra empty row for background genes which are absent in annotation
+        term_matrix = self.matrix[:, positions[found]].tocsr().astype(np.float32)
+        term_matrix = sparse.vstack([term_matrix, sparse.csr_matrix((1, term_matrix.shape[1]),
+                                                                    dtype=np.float32)]).tocsr()
+        rows = self.genes.get_indexer(universe)
+        background_matrix = term_matrix[np.where(rows >= 0, rows, len(self.genes))]
+        observed = np.asarray(background_matrix[universe.get_indexer(genes)].sum(axis=0)).ravel()
+
+        p_values = np.full(len(positions), np.nan)
+        if len(genes) == 0:
+            p_values[found] = 1.0
+            return p_values
+
+        sizes = [min(batch_size, permutations - start) for start in range(0, permutations, batch_size)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        tasks = [(s, size, len(genes), observed) for s, size in zip(seeds, sizes)]
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            _init_permutation_worker(background_matrix)
+            exceedances = sum(map(_count_exceedances, tasks))
+            _init_permutation_worker(None)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_permutation_worker,
+                                     initargs=(background_matrix,)) as executor:
+                exceedances = sum(executor.map(_count_exceedances, tasks))
+        p_values[found] = (1 + exceedances) / (1 + permutations)
+        return p_values
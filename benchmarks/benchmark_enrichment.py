@@ -0,0 +1,288 @@
+"""
+Benchmarks of EnrichmentAnalysis hot paths on synthetic data. STRING requests are replaced by synthetic responses,
+so benchmarks work without network. Every public method is timed except methods which need external tools or
+servers: 'prioretizingGO' (R), 'get_subnetwork' (ProteinNetwork) and asyncio methods (AsyncSTRINGClient).
+
+Run from root of repository:
+    python benchmarks/benchmark_enrichment.py                      # compare with benchmarks/baseline.json
+    python benchmarks/benchmark_enrichment.py --tiers small large  # choose size tiers
+    python benchmarks/benchmark_enrichment.py --save-baseline      # store results as new baseline
+
+Exit code is 1 if time or peak memory of any benchmark exceeds baseline more than --threshold times. Benchmarks
+without baseline are reported as not compared. Correctness of results is checked by tests (see 'tests').
+"""
+import argparse
+import contextlib
+import io
+import json
+import numpy as np
+import os
+import pandas as pd
+import sys
+import tempfile
+import time
+import tracemalloc
+from   unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import stringdb
+from   ProteinNetworks.STRING_enrichment import EnrichmentAnalysis
+from   ProteinNetworks.local_enrichment import AnnotationTable
+
+
+# number of proteins and number of terms of enrichment table in each size tier
+TIERS = {'small': (1000, 1000), 'medium': (5000, 5000), 'large': (20000, 20000)}
+CATEGORIES = ['Process', 'Function', 'Component', 'KEGG', 'RCTM', 'Keyword', 'InterPro']
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# timings shorter than this (in seconds) are compared with this absolute slack to ignore noise
+MIN_TIME = 0.005
+
+
+def make_proteins(n_proteins: int, seed: int = 0) -> pd.DataFrame:
+    """
+    function generates synthetic protein dataset with "Gene" and "UniProtID" columns
+    :param n_proteins: number of proteins
+    :param seed: seed of random generator
+    :return: DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    ids = rng.permutation(n_proteins)
+    return pd.DataFrame({'Gene': [f'GENE{i}' for i in ids], 'UniProtID': [f'P{i:06d}' for i in ids]})
+
+
+def make_mapping(identifiers, species=9606, **params) -> pd.DataFrame:
+    """
+    function replaces stringdb.get_string_ids: it returns synthetic mapping of identifiers (every 50th identifier
+    isn`t mapped)
+    :param identifiers: list of protein identifiers
+    :param species: ID of organism
+    :return: DataFrame with the same columns as STRING mapping results
+    """
+    identifiers = pd.Series(list(identifiers), dtype=str)
+    index = np.flatnonzero(np.arange(len(identifiers)) % 50 != 49)
+    items = identifiers.to_numpy()[index]
+    return pd.DataFrame({'queryIndex': index, 'queryItem': items,
+                         'stringId': [f'{species}.ENSP{item[1:]}' for item in items],
+                         'ncbiTaxonId': species, 'taxonName': 'Homo sapiens',
+                         'preferredName': [f'GENE{int(item[1:])}' for item in items], 'annotation': 'annotation'})
+
+
+def make_enrichment(proteins, n_terms: int, seed: int = 0) -> pd.DataFrame:
+    """
+    function generates synthetic enrichment table. Sizes of terms follow geometric distribution
+    :param proteins: list of protein identifiers (queryItem)
+    :param n_terms: number of terms
+    :param seed: seed of random generator
+    :return: DataFrame with the same columns as STRING enrichment results
+    """
+    rng = np.random.default_rng(seed)
+    proteins = np.asarray(proteins, dtype=object)
+    sizes = np.minimum(rng.geometric(1 / 30, n_terms) + 2, len(proteins))
+    genes = [proteins[rng.choice(len(proteins), size, replace=False)] for size in sizes]
+    p_values = np.sort(rng.random(n_terms) ** 4)
+    return pd.DataFrame({'category': [CATEGORIES[i % len(CATEGORIES)] for i in range(n_terms)],
+                         'term': [f'TERM:{i:07d}' for i in range(n_terms)],
+                         'number_of_genes': sizes,
+                         'number_of_genes_in_background': sizes * 20,
+                         'ncbiTaxonId': 9606,
+                         'inputGenes': [','.join(g) for g in genes],
+                         'preferredNames': [','.join(g) for g in genes],
+                         'p_value': p_values,
+                         'fdr': np.minimum(p_values * 10, 1),
+                         'description': [f'description of term {i}' for i in range(n_terms)]})
+
+
+def make_annotation(enrichment, genes_mapped) -> AnnotationTable:
+    """
+    function makes local annotation table (genes are STRING ids) from synthetic enrichment table
+    :param enrichment: enrichment table (see 'make_enrichment')
+    :param genes_mapped: mapping table (see 'make_mapping')
+    :return: AnnotationTable
+    """
+    string_ids = dict(zip(genes_mapped.queryItem, genes_mapped.stringId))
+    pairs = enrichment[['category', 'term', 'description']].assign(gene=enrichment.inputGenes.str.split(','))
+    pairs = pairs.explode('gene')
+    return AnnotationTable(pairs.assign(gene=pairs.gene.map(string_ids)))
+
+
+def make_benchmarks(n_proteins: int, n_terms: int, tmp_dir: str) -> tuple:
+    """
+    function prepares benchmarks of one size tier
+    :param n_proteins: number of proteins
+    :param n_terms: number of terms
+    :param tmp_dir: directory for saved files
+    :return: (benchmarks, response) - dict {name: (setup, call)} (setup isn`t timed, call is timed) and
+             enrichment table for stubbed stringdb.get_enrichment
+    """
+    data = make_proteins(n_proteins)
+    ea = EnrichmentAnalysis(data, protein_id_type='UniProtID')
+    ea.genes_mapped = make_mapping(ea.proteins)
+    response = make_enrichment(ea.genes_mapped.queryItem, n_terms)
+    enrichment = response.assign(enrich_score=np.round(-np.log2(response.fdr.to_numpy(dtype=float)), 1))
+    ea.enrichment = enrichment
+    components = enrichment.description[enrichment.category == 'Component'].head(3).to_list()
+    names = data.UniProtID.sample(frac=0.5, random_state=0).to_list() + ['absent name']
+    annotation = make_annotation(enrichment, ea.genes_mapped)
+    subset = ea.genes_mapped.queryItem.iloc[::3].to_list()
+    input_path = os.path.join(tmp_dir, 'proteins.csv')
+    pd.concat([data, data.head(n_proteins // 10)]).to_csv(input_path, index=False)
+    analysis_path = os.path.join(tmp_dir, 'analysis')
+    ea.save_analysis(analysis_path)
+    duplicated = {} # analysis with duplicated proteins for 'drop_duplicated_genes' (it changes data in place)
+
+    def reset():
+        ea.enrichment = enrichment # drops memoized results of previous call
+
+    def reset_duplicated():
+        duplicated['ea'] = EnrichmentAnalysis(pd.concat([data, data.head(n_proteins // 10)]),
+                                              protein_id_type='UniProtID')
+
+    benchmarks = {
+        'get_mapped': (reset, lambda: ea.get_mapped()),
+        'get_enrichment': (reset, lambda: ea.get_enrichment()),
+        'proteins_participation_in_the_category': (
+            reset, lambda: ea.proteins_participation_in_the_category(ea.enrichment, 'Process')),
+        'show_category_terms': (reset, lambda: ea.show_category_terms('Process', show=10)),
+        'get_genes_by_localization': (reset, lambda: ea.get_genes_by_localization(components, 'union')),
+        'get_genes_of_term': (reset, lambda: ea.get_genes_of_term(enrichment.term.iloc[-1])),
+        'get_category_terms': (reset, lambda: ea.get_category_terms('Process')),
+        'show_enrichment_categories': (reset, lambda: ea.show_enrichment_categories()),
+        'show_enrichest_terms_in_category': (reset, lambda: ea.show_enrichest_terms_in_category('Process')),
+        'get_enrichment_local': (reset, lambda: ea.get_enrichment(backend='local', annotation=annotation)),
+        'get_subset_enrichment': (reset, lambda: ea.get_subset_enrichment(subset, annotation)),
+        'get_permutation_fdr': (reset, lambda: ea.get_permutation_fdr(annotation, permutations=100, workers=1)),
+        'drop_duplicated_genes': (reset_duplicated, lambda: duplicated['ea'].drop_duplicated_genes()),
+        'from_file': (reset, lambda: EnrichmentAnalysis.from_file(input_path)),
+        'save_analysis': (reset, lambda: ea.save_analysis(analysis_path)),
+        'load_analysis': (reset, lambda: EnrichmentAnalysis.load_analysis(analysis_path)),
+        'save_report': (reset, lambda: ea.save_report(os.path.join(tmp_dir, 'report'), saveformat='parquet')),
+        'reduce_redundant_terms': (reset, lambda: ea.reduce_redundant_terms()),
+        'create_subframe_by_names': (reset, lambda: EnrichmentAnalysis.create_subframe_by_names(data, 'UniProtID',
+                                                                                               names)),
+        'save_table_csv': (reset, lambda: EnrichmentAnalysis.save_table(enrichment, os.path.join(tmp_dir, 'table'),
+                                                                        saveformat='csv', index=False)),
+        'save_table_parquet': (reset, lambda: EnrichmentAnalysis.save_table(enrichment,
+                                                                            os.path.join(tmp_dir, 'table'),
+                                                                            saveformat='parquet', index=False)),
+        'save_table_xlsx': (reset, lambda: EnrichmentAnalysis.save_table(enrichment, os.path.join(tmp_dir, 'table'),
+                                                                         saveformat='xlsx', index=False)),
+    }
+    return benchmarks, response
+
+
+def measure(setup, call, repeats: int) -> dict:
+    """
+    function measures the best time of call and its peak memory (by separate run under tracemalloc)
+    :param setup: function called before every run (not timed)
+    :param call: benchmarked function
+    :param repeats: number of timed runs
+    :return: dict {'time': seconds, 'peak_mb': megabytes}
+    """
+    times = []
+    for _ in range(repeats):
+        setup()
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+
+    setup()
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'time': min(times), 'peak_mb': peak / 2 ** 20}
+
+
+def run(tiers, repeats: int = 3, only=None) -> dict:
+    """
+    function runs benchmarks of chosen size tiers. stringdb requests are replaced by synthetic responses
+    :param tiers: list of names of tiers (see TIERS)
+    :param repeats: number of timed runs of each benchmark
+    :param only: list of names of benchmarks to run. None - all benchmarks
+    :return: dict {tier: {benchmark: {'time': seconds, 'peak_mb': megabytes}}}
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for tier in tiers:
+            n_proteins, n_terms = TIERS[tier]
+            with contextlib.redirect_stdout(io.StringIO()):
+                benchmarks, response = make_benchmarks(n_proteins, n_terms, tmp_dir)
+            with mock.patch.object(stringdb, 'get_string_ids', make_mapping), \
+                    mock.patch.object(stringdb, 'get_enrichment',
+                                      lambda identifiers, species=9606, **params: response.copy()):
+                results[tier] = {}
+                for name, (setup, call) in benchmarks.items():
+                    if only and name not in only:
+                        continue
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        results[tier][name] = measure(setup, call, repeats)
+                    print(f'{tier:<8} {name:<42} {results[tier][name]["time"] * 1000:10.1f} ms '
+                          f'{results[tier][name]["peak_mb"]:10.1f} MB')
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> tuple:
+    """
+    function compares results with baseline
+    :param results: results of 'run'
+    :param baseline: stored results of 'run'
+    :param threshold: maximal allowed ratio of result to baseline
+    :return: (failures, not_compared) - lists of failed checks and of benchmarks without baseline (strings)
+    """
+    failures, not_compared = [], []
+    for tier, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            reference = baseline.get(tier, {}).get(name)
+            if reference is None:
+                not_compared.append(f'{tier}/{name}')
+                continue
+            if result['time'] > max(reference['time'], MIN_TIME) * threshold:
+                failures.append(f'{tier}/{name}: time {result["time"] * 1000:.1f} ms, '
+                                f'baseline {reference["time"] * 1000:.1f} ms')
+            if result['peak_mb'] > max(reference['peak_mb'], 1) * threshold:
+                failures.append(f'{tier}/{name}: peak memory {result["peak_mb"]:.1f} MB, '
+                                f'baseline {reference["peak_mb"]:.1f} MB')
+    return failures, not_compared
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmarks of EnrichmentAnalysis hot paths on synthetic data')
+    parser.add_argument('--tiers', nargs='+', default=['small', 'medium'], choices=list(TIERS))
+    parser.add_argument('--benchmarks', nargs='+', default=None, help='names of benchmarks to run')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='path to baseline json file')
+    parser.add_argument('--threshold', type=float, default=1.5, help='maximal allowed ratio to baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='store results as baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.tiers, repeats=args.repeats, only=args.benchmarks)
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        for tier, benchmarks in results.items():
+            baseline.setdefault(tier, {}).update(benchmarks)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f'Baseline saved in {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'Baseline {args.baseline} not found. Make it by --save-baseline')
+        return 0
+    with open(args.baseline) as f:
+        failures, not_compared = compare(results, json.load(f), args.threshold)
+    if not_compared:
+        print('NOT COMPARED (no baseline, make it by --save-baseline):\n  ' + '\n  '.join(not_compared))
+    if failures:
+        print('FAILED:\n  ' + '\n  '.join(failures))
+        return 1
+    total = sum(len(benchmarks) for benchmarks in results.values())
+    print(f'PASSED ({total - len(not_compared)} of {total} benchmarks compared)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
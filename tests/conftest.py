@@ -0,0 +1,83 @@
+from   http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from   urllib.parse import parse_qs
+import zlib
+
+import pytest
+
+
+MAPPING_COLUMNS = ['queryIndex', 'queryItem', 'stringId', 'ncbiTaxonId', 'taxonName', 'preferredName', 'annotation']
+ENRICHMENT_TABLE = ('category\tterm\tnumber_of_genes\tnumber_of_genes_in_background\tncbiTaxonId\t'
+                    'inputGenes\tpreferredNames\tp_value\tfdr\tdescription\n'
+                    'Process\tGO:0008150\t3\t100\t9606\tA,B,C\tA,B,C\t0.0001\t0.001\tbiological_process\n'
+                    'KEGG\thsa00010\t2\t50\t9606\tA,B\tA,B\t0.001\t0.01\tGlycolysis\n')
+
+
+class STRINGStandIn:
+    """
+    Local stand-in of STRING API. 'get_string_ids' maps every identifier except ones starting with 'unknown',
+    'enrichment' returns ENRICHMENT_TABLE. Statuses queued in 'statuses' (by method) are returned before answers
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.statuses = {}
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def queue(self, method: str, *statuses) -> None:
+        with self._lock:
+            self.statuses.setdefault(method, []).extend(statuses)
+
+    def calls(self, method: str) -> list:
+        with self._lock:
+            return [params for name, params in self.requests if name == method]
+
+    def respond(self, method: str, params: dict):
+        """
+        function returns status and body of response to request
+        """
+        with self._lock:
+            self.requests.append((method, params))
+            queued = self.statuses.get(method)
+            if queued:
+                return queued.pop(0), ''
+        if method == 'get_string_ids':
+            identifiers = params.get('identifiers', [''])[0].split('\r')
+            species = params.get('species', ['9606'])[0]
+            rows = ['\t'.join(map(str, [i, name, f'{species}.ENSP{zlib.crc32(name.encode()) % 10 ** 8:08d}', species,
+                                        'Homo sapiens', name.upper(), f'annotation of {name}']))
+                    for i, name in enumerate(identifiers) if name and not name.startswith('unknown')]
+            return 200, '\n'.join(['\t'.join(MAPPING_COLUMNS)] + rows) + '\n' if rows else ''
+        if method == 'enrichment':
+            return 200, ENRICHMENT_TABLE
+        return 400, ''
+
+
+@pytest.fixture
+def string_server():
+    """
+    fixture starts local STRING stand-in in thread and yields STRINGStandIn object with its url
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf8')
+            status, content = stand_in.respond(self.path.rstrip('/').split('/')[-1], parse_qs(body))
+            content = content.encode('utf8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/tab-separated-values')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    stand_in = STRINGStandIn(f'http://127.0.0.1:{server.server_address[1]}/api')
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+    thread.start()
+    yield stand_in
+    server.shutdown()
+    server.server_close()
+    thread.join()
@@ -0,0 +1,76 @@
+from   ProteinNetworks import STRING_requests
+from   ProteinNetworks.STRING_enrichment import EnrichmentAnalysis
+from   ProteinNetworks.STRING_requests import AsyncSTRINGClient
+
+import asyncio
+import pandas as pd
+import pytest
+import stringdb
+
+
+COHORTS = {'first': ['TP53', 'unknown1', 'BRCA1', 'EGFR', 'MYC', 'unknown2', 'KRAS', 'PTEN', 'AKT1', 'CDK2'],
+           'second': ['A', 'B', 'C', 'unknown3', 'D', 'E', 'F', 'G'],
+           'third': ['unknown4', 'TP53']}
+
+
+@pytest.fixture
+def sync_server(string_server, monkeypatch):
+    """
+    fixture sends requests of sync paths (stringdb functions and 'get_string_ids_batched') to local stand-in
+    """
+    monkeypatch.setattr(stringdb.api, 'build_request_url',
+                        lambda method, output_format='tsv': f'{string_server.url}/{output_format}/{method}')
+    monkeypatch.setattr(STRING_requests, 'STRING_API_URL', string_server.url)
+    return string_server
+
+
+def make_analysis(genes):
+    return EnrichmentAnalysis(pd.DataFrame({'Gene': genes}), protein_id_type='Gene')
+
+
+def map_sync(genes, chunk_size):
+    analysis = make_analysis(genes)
+    analysis.get_mapped(chunk_size=chunk_size, workers=3)
+    return analysis
+
+
+async def map_async(api_url, cohorts, chunk_size, concurrency=4):
+    analyses = {name: make_analysis(genes) for name, genes in cohorts.items()}
+    async with AsyncSTRINGClient(concurrency=concurrency, api_url=api_url, backoff=0.001) as client:
+        await asyncio.gather(*[analysis.aget_mapped(client=client, chunk_size=chunk_size)
+                               for analysis in analyses.values()])
+    return analyses
+
+
+@pytest.mark.parametrize('chunk_size', [None, 1, 3, 100])
+def test_concurrent_async_mapping_equals_sync(sync_server, chunk_size):
+    analyses = asyncio.run(map_async(sync_server.url, COHORTS, chunk_size))
+    for name, genes in COHORTS.items():
+        for sync_chunk_size in (None, 3):
+            expected = map_sync(genes, sync_chunk_size)
+            pd.testing.assert_frame_equal(analyses[name].genes_mapped, expected.genes_mapped)
+            assert list(analyses[name].nomapped_genes) == list(expected.nomapped_genes)
+            assert list(analyses[name].overmapped_genes) == list(expected.overmapped_genes)
+
+
+def test_async_mapping_retries_like_sync(sync_server):
+    sync_server.queue('get_string_ids', 503, 429)
+    analyses = asyncio.run(map_async(sync_server.url, {'first': COHORTS['first']}, chunk_size=4, concurrency=1))
+    pd.testing.assert_frame_equal(analyses['first'].genes_mapped, map_sync(COHORTS['first'], None).genes_mapped)
+
+
+def test_async_enrichment_equals_sync(sync_server):
+    expected = map_sync(COHORTS['first'], None)
+    expected.get_enrichment()
+
+    async def enrich():
+        async with AsyncSTRINGClient(api_url=sync_server.url, backoff=0.001) as client:
+            analysis = make_analysis(COHORTS['first'])
+            await analysis.aget_mapped(client=client)
+            await analysis.aget_enrichment(client=client)
+            return analysis
+
+    analysis = asyncio.run(enrich())
+    pd.testing.assert_frame_equal(analysis.enrichment, expected.enrichment)
+    first, second = sync_server.calls('enrichment')
+    assert first['identifiers'] == second['identifiers']
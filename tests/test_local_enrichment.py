@@ -0,0 +1,133 @@
+from   ProteinNetworks.local_enrichment import AnnotationTable, benjamini_hochberg
+
+import numpy as np
+import pandas as pd
+import pytest
+from   scipy.stats import hypergeom
+
+
+GENES = [f'GENE{i}' for i in range(200)]
+
+
+def reference_fdr(p_values):
+    """
+    straightforward Benjamini-Hochberg procedure
+    """
+    n = len(p_values)
+    order = sorted(range(n), key=lambda i: p_values[i])
+    fdr, current = [0.0] * n, 1.0
+    for rank in range(n, 0, -1):
+        i = order[rank - 1]
+        current = min(current, p_values[i] * n / rank)
+        fdr[i] = current
+    return fdr
+
+
+def reference_enrich(annotation, genes, background=None):
+    """
+    straightforward enrichment: hypergeometric test of every term separately, FDR within each category
+    :return: DataFrame with 'category', 'term', 'number_of_genes', 'number_of_genes_in_background', 'inputGenes',
+             'p_value', 'fdr' columns
+    """
+    universe = set(annotation.gene) | set(genes) if background is None else set(background)
+    genes = [gene for gene in dict.fromkeys(genes) if gene in universe]
+    rows = []
+    for (category, term), group in annotation.groupby(['category', 'term'], sort=False):
+        members = set(group.gene) & universe
+        hits = [gene for gene in genes if gene in members]
+        if hits:
+            rows.append({'category': category, 'term': term, 'number_of_genes': len(hits),
+                         'number_of_genes_in_background': len(members), 'inputGenes': ','.join(hits),
+                         'p_value': max(hypergeom.sf(len(hits) - 1, len(universe), len(members), len(genes)),
+                                        np.finfo(float).tiny)})
+    df = pd.DataFrame(rows)
+    df['fdr'] = np.nan
+    for category, group in df.groupby('category'):
+        df.loc[group.index, 'fdr'] = reference_fdr(group.p_value.tolist())
+    return df
+
+
+@pytest.fixture
+def annotation():
+    rng = np.random.default_rng(0)
+    random_terms = pd.DataFrame({'gene': rng.choice(GENES, 3000),
+                                 'category': rng.choice(['Process', 'KEGG', 'COMPARTMENTS'], 3000),
+                                 'term': [f'TERM:{i:07d}' for i in rng.integers(0, 60, 3000)],
+                                 'description': ''})
+    # terms enriched by query
+    planted = pd.DataFrame({'gene': GENES[:20] * 2, 'category': ['Process'] * 20 + ['KEGG'] * 20,
+                            'term': 'TERM:PLANTED', 'description': 'planted term'})
+    return pd.concat([random_terms, planted], ignore_index=True).drop_duplicates(['gene', 'category', 'term'])
+
+
+@pytest.fixture
+def query():
+    rng = np.random.default_rng(1)
+    return GENES[:15] + list(rng.choice(GENES[20:], 30, replace=False)) + ['NOT_ANNOTATED1', 'NOT_ANNOTATED2']
+
+
+def compare(result, expected):
+    result = result.set_index(['category', 'term']).sort_index()
+    expected = expected.set_index(['category', 'term']).sort_index()
+    assert result.index.equals(expected.index)
+    assert (result.number_of_genes == expected.number_of_genes).all()
+    assert (result.number_of_genes_in_background == expected.number_of_genes_in_background).all()
+    assert (result.inputGenes == expected.inputGenes).all()
+    np.testing.assert_allclose(result.p_value, expected.p_value, rtol=1e-9)
+    np.testing.assert_allclose(result.fdr, expected.fdr, rtol=1e-9)
+
+
+def test_benjamini_hochberg_equals_reference():
+    rng = np.random.default_rng(2)
+    p_values = rng.random(500) ** 3
+    groups = rng.choice(['a', 'b', 'c'], 500)
+    fdr = benjamini_hochberg(p_values, groups)
+    for group in 'abc':
+        np.testing.assert_allclose(fdr[groups == group], reference_fdr(list(p_values[groups == group])))
+    np.testing.assert_allclose(benjamini_hochberg(p_values), reference_fdr(list(p_values)))
+    assert len(benjamini_hochberg([])) == 0
+
+
+def test_enrich_equals_reference(annotation, query):
+    compare(AnnotationTable(annotation).enrich(query, fdr_threshold=None), reference_enrich(annotation, query))
+
+
+def test_enrich_with_background_equals_reference(annotation, query):
+    background = GENES[::2] + ['NOT_ANNOTATED1']
+    compare(AnnotationTable(annotation).enrich(query, background=background, fdr_threshold=None),
+            reference_enrich(annotation, query, background))
+
+
+def test_duplicated_input_genes_do_not_change_results(annotation, query):
+    table = AnnotationTable(annotation)
+    unique = table.enrich(query, fdr_threshold=None)
+    duplicated = table.enrich(query * 3, fdr_threshold=None)
+    pd.testing.assert_frame_equal(unique, duplicated)
+
+
+def test_given_counts_equal_counted(annotation, query):
+    table = AnnotationTable(annotation)
+    _, counts = table.overlap_counts(query)
+    for categories in (None, ['KEGG'], ['unknown category']):
+        pd.testing.assert_frame_equal(table.enrich(query, counts=counts, categories=categories),
+                                      table.enrich(query, categories=categories))
+
+
+def test_updated_counts_equal_counted(annotation, query):
+    table = AnnotationTable(annotation)
+    base = table.overlap_counts(query)
+    subset = query[::2] + GENES[-10:]
+    rows, counts = table.overlap_counts(subset, base=base)
+    expected_rows, expected_counts = table.overlap_counts(subset)
+    np.testing.assert_array_equal(rows, expected_rows)
+    np.testing.assert_array_equal(counts, expected_counts)
+
+
+def test_fdr_threshold_and_categories(annotation, query):
+    table = AnnotationTable(annotation)
+    full = table.enrich(query, fdr_threshold=None)
+    result = table.enrich(query, fdr_threshold=0.05, categories=['Process', 'KEGG'])
+    assert len(result) > 0 and (result.fdr <= 0.05).all() and set(result.category) <= {'Process', 'KEGG'}
+    expected = table.enrich(query, fdr_threshold=None, categories=['Process', 'KEGG'])
+    pd.testing.assert_frame_equal(result, expected[expected.fdr <= 0.05].reset_index(drop=True))
+    assert len(full) >= len(expected)
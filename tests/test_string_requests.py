@@ -0,0 +1,80 @@
+from   ProteinNetworks import STRING_requests
+from   ProteinNetworks.STRING_requests import get_string_ids_batched, post_string_request
+
+import pandas as pd
+import pytest
+import requests
+import socket
+
+
+GENES = ['TP53', 'unknown1', 'BRCA1', 'EGFR', 'MYC', 'unknown2', 'KRAS', 'PTEN', 'AKT1', 'TP53', 'CDK2']
+
+
+def mapping_params(identifiers):
+    return {'identifiers': '\r'.join(identifiers), 'species': 9606, 'limit': 1, 'echo_query': 1}
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_transient_status_is_retried(string_server, status):
+    string_server.queue('get_string_ids', status, status)
+    df = post_string_request('get_string_ids', mapping_params(GENES), api_url=string_server.url, retries=3,
+                             backoff=0.001)
+    assert len(string_server.calls('get_string_ids')) == 3
+    assert df.queryItem.tolist() == [gene for gene in GENES if not gene.startswith('unknown')]
+
+
+@pytest.mark.parametrize('status', [400, 404])
+def test_permanent_status_is_not_retried(string_server, status):
+    string_server.queue('get_string_ids', status)
+    with pytest.raises(ValueError):
+        post_string_request('get_string_ids', mapping_params(GENES), api_url=string_server.url, retries=3,
+                            backoff=0.001)
+    assert len(string_server.calls('get_string_ids')) == 1
+
+
+def test_retries_are_exhausted(string_server):
+    string_server.queue('get_string_ids', *[503] * 3)
+    with pytest.raises(ValueError):
+        post_string_request('get_string_ids', mapping_params(GENES), api_url=string_server.url, retries=2,
+                            backoff=0.001)
+    assert len(string_server.calls('get_string_ids')) == 3
+
+
+def test_connection_error_is_retried(monkeypatch):
+    with socket.socket() as sock:  # port is free after closing, so connection is refused
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    pauses = []
+    monkeypatch.setattr(STRING_requests.time, 'sleep', pauses.append)
+    with pytest.raises(requests.ConnectionError):
+        post_string_request('get_string_ids', mapping_params(GENES), api_url=f'http://127.0.0.1:{port}/api',
+                            retries=2, backoff=0.5)
+    assert pauses == [0.5, 1]
+
+
+def test_nothing_found_gives_empty_table(string_server):
+    df = post_string_request('get_string_ids', mapping_params(['unknown1', 'unknown2']), api_url=string_server.url)
+    assert df.empty
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 4, len(GENES), 100])
+def test_batched_mapping_equals_single_request(string_server, chunk_size):
+    single = post_string_request('get_string_ids', mapping_params(GENES), api_url=string_server.url)
+    batched = get_string_ids_batched(GENES, chunk_size=chunk_size, workers=3, backoff=0.001,
+                                     api_url=string_server.url)
+    assert len(string_server.calls('get_string_ids')) == 1 + -(-len(GENES) // chunk_size)
+    pd.testing.assert_frame_equal(batched[single.columns], single)
+    assert [GENES[i] for i in batched.queryIndex] == batched.queryItem.tolist()
+
+
+def test_batched_mapping_retries_failed_chunk(string_server):
+    string_server.queue('get_string_ids', 503)
+    batched = get_string_ids_batched(GENES, chunk_size=4, workers=1, backoff=0.001, api_url=string_server.url)
+    assert len(string_server.calls('get_string_ids')) == 4
+    assert [GENES[i] for i in batched.queryIndex] == batched.queryItem.tolist()
+
+
+def test_batched_mapping_of_empty_list(string_server):
+    batched = get_string_ids_batched([], api_url=string_server.url)
+    assert batched.empty and 'queryIndex' in batched.columns
+    assert string_server.calls('get_string_ids') == []